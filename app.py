@@ -15,6 +15,18 @@ def main():
     from modules.utils import create_directories
     create_directories()
     
+    # 预热代码执行进程池
+    from modules.code_executor import warm_up_executor
+    warm_up_executor()
+    
+    # 启动后台图表回收
+    from modules.figure_store import start_figure_gc
+    start_figure_gc()
+    
+    # 启动指标接口（设置 CHATANALYST_METRICS=1 时）
+    from modules.metrics import start_metrics_server
+    start_metrics_server()
+    
     # 检查用户是否已登录
     if not check_authentication():
         login_page()
@@ -0,0 +1,56 @@
+"""比较两次基准测试的结果
+
+用法:
+    python -m benchmarks.compare baseline.json current.json [--threshold 1.10]
+
+按中位数比较，current 比 baseline 慢超过阈值的条目视为性能回退，此时以非零状态退出。
+"""
+import sys
+import json
+import argparse
+
+
+def _key(result):
+    return result["name"], json.dumps(result["params"], sort_keys=True, ensure_ascii=False)
+
+
+def load_results(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return {_key(result): result for result in json.load(f)["results"]}
+
+
+# 返回 [(名称, 参数, 基线中位数, 当前中位数, 比值)]
+def compare(baseline, current):
+    rows = []
+    for key, result in current.items():
+        if key not in baseline:
+            continue
+        before, after = baseline[key]["median"], result["median"]
+        rows.append((key[0], key[1], before, after, after / before if before > 0 else float("inf")))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="比较两次基准测试的结果")
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=1.10, help="慢于基线这个倍数时视为回退")
+    args = parser.parse_args(argv)
+
+    rows = compare(load_results(args.baseline), load_results(args.current))
+    regressions = 0
+    for name, params, before, after, ratio in rows:
+        flag = ""
+        if ratio > args.threshold:
+            flag = "  <-- 回退"
+            regressions += 1
+        elif ratio < 1 / args.threshold:
+            flag = "  (提升)"
+        print(f"{name:<28} {params:<60} {before * 1000:10.2f} ms -> {after * 1000:10.2f} ms  x{ratio:.2f}{flag}")
+
+    print(f"共比较 {len(rows)} 项，回退 {regressions} 项")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+"""基准测试用的合成数据集"""
+import os
+import numpy as np
+import pandas as pd
+
+# 各数据集在 scale=1 时的行数和列数
+NUMERIC_SHAPE = (1_000_000, 20)
+WIDE_SHAPE = (100_000, 2_000)
+MIXED_ROWS = 500_000
+XLSX_ROWS = 50_000
+XLSX_SHEETS = 3
+
+
+def _rows(rows, scale):
+    return max(int(rows * scale), 10)
+
+
+# 1M×20 数值表
+def make_numeric_csv(path, scale=1.0, seed=0):
+    rows, cols = NUMERIC_SHAPE
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(rng.normal(size=(_rows(rows, scale), cols)), columns=[f"x{i}" for i in range(cols)])
+    df.to_csv(path, index=False)
+    return path
+
+
+# 100k×2000 宽表（列名带编号，用于测试宽表的概况摘要）
+def make_wide_csv(path, scale=1.0, seed=0):
+    rows, cols = WIDE_SHAPE
+    rng = np.random.default_rng(seed)
+    columns = [f"sensor_{i}" for i in range(cols // 2)] + [f"metric_{i}" for i in range(cols - cols // 2)]
+    df = pd.DataFrame(rng.random(size=(_rows(rows, scale), cols), dtype=np.float32), columns=columns)
+    df.to_csv(path, index=False, float_format="%.4f")
+    return path
+
+
+def _mixed_frame(rows, rng):
+    categories = np.array(["北京", "上海", "广州", "深圳", "杭州", "成都"])
+    return pd.DataFrame({
+        "order_id": np.arange(rows),
+        "city": categories[rng.integers(0, len(categories), rows)],
+        "customer": [f"user_{i}" for i in rng.integers(0, 50_000, rows)],
+        "order_date": pd.Timestamp("2023-01-01") + pd.to_timedelta(rng.integers(0, 730, rows), unit="D"),
+        "amount": rng.gamma(2.0, 50.0, rows).round(2),
+        "quantity": rng.integers(1, 20, rows),
+        "note": np.where(rng.random(rows) < 0.2, None, "正常")
+    })
+
+
+# 字符串、日期和数值混合的订单表
+def make_mixed_csv(path, scale=1.0, seed=0):
+    rng = np.random.default_rng(seed)
+    _mixed_frame(_rows(MIXED_ROWS, scale), rng).to_csv(path, index=False)
+    return path
+
+
+# 多工作表的Excel文件
+def make_multisheet_xlsx(path, scale=1.0, seed=0):
+    rng = np.random.default_rng(seed)
+    with pd.ExcelWriter(path) as writer:
+        for i in range(XLSX_SHEETS):
+            _mixed_frame(_rows(XLSX_ROWS, scale), rng).to_excel(writer, sheet_name=f"sheet{i + 1}", index=False)
+    return path
+
+
+DATASETS = {
+    "numeric_1m_x20.csv": make_numeric_csv,
+    "wide_100k_x2000.csv": make_wide_csv,
+    "mixed.csv": make_mixed_csv,
+    "multisheet.xlsx": make_multisheet_xlsx
+}
+
+
+# 生成所有数据集（已存在的文件直接复用）
+def build_datasets(data_dir, scale=1.0, names=None):
+    os.makedirs(data_dir, exist_ok=True)
+    paths = {}
+    for name, build in DATASETS.items():
+        if names and name not in names:
+            continue
+        path = os.path.join(data_dir, name)
+        if not os.path.exists(path):
+            build(path, scale)
+        paths[name] = path
+    return paths
@@ -0,0 +1,381 @@
+"""多用户端到端压测：模拟多个用户同时使用 app.py（登录、上传、提问、切换对话）
+
+模型请求发往本地的 OpenAI 兼容桩服务（benchmarks/stub_server.py），不会访问真实的推理集群。
+每个模拟用户是一个独立的 Streamlit AppTest 会话，所有会话在同一进程中运行，与单个服务副本一致。
+
+用法（在项目根目录下）:
+    python -m benchmarks.load_test --users 20 --questions 4
+    python -m benchmarks.load_test --users 50 --latency 1.0 --tokens-per-second 30 --output load.json
+
+报告每轮对话延迟的 p50/p95/p99、吞吐量以及服务进程（含代码执行工作进程）的内存占用。
+"""
+import os
+import sys
+import json
+import time
+import socket
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import urllib.request
+from datetime import datetime
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+logging.getLogger("streamlit").setLevel(logging.ERROR)
+
+from streamlit.testing.v1 import AppTest  # noqa: E402
+from benchmarks.datasets import MIXED_ROWS, make_mixed_csv  # noqa: E402
+
+APP_FILE = os.path.join(REPO_ROOT, "app.py")
+
+# 走本地模板的问题和需要模型生成代码的问题
+TEMPLATE_QUESTIONS = ["描述统计", "缺失值统计", "数据概览"]
+MODEL_QUESTIONS = ["请按城市分组统计销售额的平均值并比较", "每个城市的订单数量和总销售额分别是多少", "筛选出金额最高的前十个订单"]
+CHAT_QUESTION = "你好，你能做哪些数据分析？"
+PASSWORD = "load-test"
+
+
+def _percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def summarize(values):
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values),
+        "p50": _percentile(values, 50),
+        "p95": _percentile(values, 95),
+        "p99": _percentile(values, 99),
+        "max": max(values)
+    }
+
+
+# ---------- 内存采样 ----------
+
+def _rss_mb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def _child_pids(parent_pid):
+    pids = []
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return pids
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == parent_pid:
+            pids.append(int(entry))
+    return pids
+
+
+class MemorySampler:
+    """定时采样本进程和工作进程的常驻内存（需要 /proc，其他平台记为 0）"""
+
+    def __init__(self, interval=0.5, exclude=()):
+        self.interval = interval
+        self.exclude = set(exclude)
+        self.peak_main = 0.0
+        self.peak_total = 0.0
+        self.last_main = 0.0
+        self.last_total = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="memory-sampler", daemon=True)
+
+    def sample(self):
+        pid = os.getpid()
+        main = _rss_mb(pid)
+        total = main + sum(_rss_mb(child) for child in _child_pids(pid) if child not in self.exclude)
+        self.last_main, self.last_total = main, total
+        self.peak_main = max(self.peak_main, main)
+        self.peak_total = max(self.peak_total, total)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.sample()
+            self._stop.wait(self.interval)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+        return {
+            "peak_main_rss_mb": round(self.peak_main, 1),
+            "peak_total_rss_mb": round(self.peak_total, 1),
+            "final_main_rss_mb": round(self.last_main, 1),
+            "final_total_rss_mb": round(self.last_total, 1)
+        }
+
+
+# ---------- 模型桩服务 ----------
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_stub_process(args):
+    port = _free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.stub_server", "--port", str(port),
+         "--latency", str(args.latency), "--tokens-per-second", str(args.tokens_per_second),
+         "--response-tokens", str(args.response_tokens)],
+        cwd=REPO_ROOT, stdout=subprocess.DEVNULL
+    )
+    base_url = f"http://127.0.0.1:{port}/v1"
+    deadline = time.time() + 15
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f"{base_url}/models", timeout=1).read()
+            return process, base_url
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("模型桩服务启动失败")
+
+
+# ---------- 模拟用户 ----------
+
+def _share_runtime_between_sessions():
+    """AppTest 每次运行时替换全局 Runtime 实例，结束时将其置空；多个会话并发运行时，
+    后结束的会话会找不到 Runtime。这里在实例为空时返回一个共享的模拟 Runtime。"""
+    from unittest.mock import MagicMock
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+
+    shared = MagicMock(spec=Runtime)
+    shared.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    original = Runtime.instance.__func__
+
+    def instance(cls):
+        if cls._instance is None:
+            return shared
+        return original(cls)
+
+    Runtime.instance = classmethod(instance)
+
+
+class UserSession:
+    def __init__(self, index, args, dataset_bytes, results, results_lock):
+        self.username = f"load_user_{index}"
+        self.index = index
+        self.args = args
+        self.dataset_bytes = dataset_bytes
+        self.results = results
+        self.results_lock = results_lock
+        self.at = AppTest.from_file(APP_FILE, default_timeout=args.timeout)
+
+    def _record(self, kind, started, ok=True, error=None):
+        elapsed = time.perf_counter() - started
+        with self.results_lock:
+            self.results.append({"user": self.username, "kind": kind, "seconds": elapsed, "ok": ok, "error": error})
+
+    def _check(self):
+        if self.at.exception:
+            raise RuntimeError(self.at.exception[0].message)
+
+    def _job_active(self):
+        return bool(self.at.chat_input) and self.at.chat_input[0].proto.disabled
+
+    def _timed(self, kind, action):
+        started = time.perf_counter()
+        try:
+            action()
+            self._check()
+            self._record(kind, started)
+        except Exception as e:
+            self._record(kind, started, ok=False, error=str(e))
+
+    def login(self):
+        self.at.run()
+        self.at.text_input(key="login_username").input(self.username)
+        self.at.text_input(key="login_password").input(PASSWORD)
+        self.at.button(key="login_button").click().run()
+
+    def upload(self):
+        self.at.sidebar.file_uploader[0].set_value(("orders.csv", self.dataset_bytes, "text/csv")).run()
+
+    def ask(self, question):
+        self.at.chat_input[0].set_value(question).run()
+        # 分析任务在后台队列中执行，定时重新运行页面直到任务结束
+        deadline = time.perf_counter() + self.args.timeout
+        while self._job_active():
+            if time.perf_counter() > deadline:
+                raise TimeoutError("等待分析结果超时")
+            time.sleep(self.args.poll_interval)
+            self.at.run()
+
+    def new_conversation(self):
+        next(b for b in self.at.sidebar.button if b.label == "新增对话").click().run()
+
+    def run(self):
+        self._timed("login", self.login)
+        self._timed("chat", lambda: self.ask(CHAT_QUESTION))
+        self._timed("upload", self.upload)
+        for i in range(self.args.questions):
+            if i % 2 == 0:
+                question = TEMPLATE_QUESTIONS[(self.index + i) % len(TEMPLATE_QUESTIONS)]
+                kind = "analysis_template"
+            else:
+                question = MODEL_QUESTIONS[(self.index + i) % len(MODEL_QUESTIONS)]
+                kind = "analysis_model"
+            self._timed(kind, lambda: self.ask(question))
+        # 切换到新对话后重新上传并提问
+        self._timed("switch_conversation", self.new_conversation)
+        self._timed("upload", self.upload)
+        self._timed("analysis_model", lambda: self.ask(MODEL_QUESTIONS[self.index % len(MODEL_QUESTIONS)]))
+
+
+def _setup_workdir(args, base_url):
+    from modules.utils import create_directories
+    from modules.model_config import DEFAULT_CONFIG, save_model_config
+    from modules.auth import register_user
+
+    create_directories()
+    save_model_config({
+        **DEFAULT_CONFIG,
+        "base_url": base_url,
+        "api_key": "stub",
+        "model_name": "stub-model",
+        "response_cache": args.response_cache
+    })
+    for i in range(args.users):
+        register_user(f"load_user_{i}", PASSWORD)
+
+    dataset_path = make_mixed_csv(os.path.join(tempfile.gettempdir(), f"load_orders_{os.getpid()}.csv"),
+                                  scale=args.rows / MIXED_ROWS)
+    with open(dataset_path, "rb") as f:
+        data = f.read()
+    os.remove(dataset_path)
+    return data
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ChatAnalyst 多用户端到端压测")
+    parser.add_argument("--users", type=int, default=10, help="并发用户数")
+    parser.add_argument("--questions", type=int, default=4, help="每个用户在第一个对话中的提问数")
+    parser.add_argument("--rows", type=int, default=20_000, help="上传数据集的行数")
+    parser.add_argument("--ramp-up", type=float, default=2.0, help="所有用户在这段时间（秒）内依次开始")
+    parser.add_argument("--latency", type=float, default=0.5, help="桩服务首个token前的延迟（秒）")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0, help="桩服务的流式输出速率")
+    parser.add_argument("--response-tokens", type=int, default=60, help="桩服务文本回复的token数")
+    parser.add_argument("--base-url", help="使用已启动的桩服务或其他兼容服务，而不是自动启动桩服务")
+    parser.add_argument("--response-cache", action="store_true", help="启用模型回复缓存（默认关闭，避免缓存命中影响结果）")
+    parser.add_argument("--timeout", type=float, default=180.0, help="单轮操作的超时时间（秒）")
+    parser.add_argument("--poll-interval", type=float, default=0.2, help="查询分析任务状态的间隔（秒）")
+    parser.add_argument("--workdir", help="运行目录（默认使用临时目录）")
+    parser.add_argument("--output", help="结果 JSON 文件路径")
+    args = parser.parse_args(argv)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="chatanalyst_load_")
+    cleanup = args.workdir is None
+    os.makedirs(workdir, exist_ok=True)
+
+    stub_process = None
+    if args.base_url:
+        base_url = args.base_url
+    else:
+        stub_process, base_url = start_stub_process(args)
+
+    original_cwd = os.getcwd()
+    results, results_lock = [], threading.Lock()
+    try:
+        os.chdir(workdir)
+        _share_runtime_between_sessions()
+        dataset_bytes = _setup_workdir(args, base_url)
+        sessions = [UserSession(i, args, dataset_bytes, results, results_lock) for i in range(args.users)]
+
+        sampler = MemorySampler(exclude=[stub_process.pid] if stub_process else ()).start()
+        started = time.perf_counter()
+        threads = []
+        for i, session in enumerate(sessions):
+            thread = threading.Thread(target=session.run, name=f"user-{i}")
+            thread.start()
+            threads.append(thread)
+            if args.users > 1:
+                time.sleep(args.ramp_up / args.users)
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - started
+        memory = sampler.stop()
+    finally:
+        os.chdir(original_cwd)
+        if stub_process:
+            stub_process.terminate()
+            stub_process.wait()
+        if cleanup:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    ok = [r for r in results if r["ok"]]
+    turns = [r for r in ok if r["kind"] in ("chat", "analysis_template", "analysis_model")]
+    kinds = sorted({r["kind"] for r in results})
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "users": args.users,
+            "questions": args.questions,
+            "rows": args.rows,
+            "stub": {"latency": args.latency, "tokens_per_second": args.tokens_per_second,
+                     "response_tokens": args.response_tokens, "base_url": args.base_url}
+        },
+        "wall_seconds": wall,
+        "turns": summarize([r["seconds"] for r in turns]),
+        "by_kind": {kind: summarize([r["seconds"] for r in ok if r["kind"] == kind]) for kind in kinds},
+        "throughput_turns_per_second": len(turns) / wall if wall > 0 else 0.0,
+        "errors": [r for r in results if not r["ok"]],
+        "memory": memory
+    }
+
+    print(f"用户数: {args.users}，总耗时: {wall:.1f} 秒，完成对话轮数: {len(turns)}，失败: {len(report['errors'])}")
+    print(f"吞吐量: {report['throughput_turns_per_second']:.2f} 轮/秒")
+    for kind, stats in [("all", report["turns"])] + list(report["by_kind"].items()):
+        if stats["count"]:
+            print(f"{kind:<20} n={stats['count']:<5} p50={stats['p50']:.2f}s  p95={stats['p95']:.2f}s  p99={stats['p99']:.2f}s")
+    print(f"内存: 主进程峰值 {memory['peak_main_rss_mb']} MB，含工作进程峰值 {memory['peak_total_rss_mb']} MB")
+    for error in report["errors"][:5]:
+        print(f"错误 [{error['user']} {error['kind']}]: {error['error']}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入: {args.output}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
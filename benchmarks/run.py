@@ -0,0 +1,324 @@
+"""数据加载、数据概况、代码执行和对话历史等热点路径的离线基准测试
+
+用法（在项目根目录下）:
+    python -m benchmarks.run                      # 完整规模
+    python -m benchmarks.run --scale 0.01         # 快速冒烟
+    python -m benchmarks.run --only load history  # 只运行部分基准
+
+结果写入 JSON 文件，可用 benchmarks/compare.py 比较两个版本的结果。
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+import warnings
+from datetime import datetime
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+# 会话状态在无 Streamlit 运行时的情况下使用，屏蔽相应的警告。Streamlit 创建日志记录器时会设置
+# 其级别（覆盖 logging 中的设置），因此需在导入项目模块前通过 Streamlit 的配置和接口设置日志级别
+os.environ.setdefault("STREAMLIT_LOGGER_LEVEL", "error")
+import streamlit.logger  # noqa: E402
+streamlit.logger.set_log_level(os.environ["STREAMLIT_LOGGER_LEVEL"])
+
+# 图表中的中文在没有中文字体的机器上会产生大量警告，不影响计时
+warnings.filterwarnings("ignore", message="Glyph .* missing from font")
+
+import pandas as pd  # noqa: E402
+import streamlit as st  # noqa: E402
+from benchmarks.datasets import build_datasets  # noqa: E402
+
+# 内置模板对应的问题
+TEMPLATE_QUESTIONS = {
+    "describe": "描述统计",
+    "correlation": "相关性分析",
+    "histogram": "分布直方图",
+    "missing": "缺失值统计",
+    "overview": "数据概览"
+}
+HISTORY_SIZES = [10, 100, 1000]
+CONVERSATION_FILES = 5000
+
+BENCHMARKS = {}
+
+
+def benchmark(group):
+    def decorator(fn):
+        BENCHMARKS[group] = fn
+        return fn
+    return decorator
+
+
+# 计时：每次运行前执行 setup（不计入耗时），返回统计结果
+def measure(fn, repeat, setup=None):
+    timings = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return {
+        "repeat": repeat,
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "mean": statistics.fmean(timings),
+        "max": max(timings)
+    }
+
+
+class Recorder:
+    def __init__(self):
+        self.results = []
+
+    def add(self, name, params, stats):
+        self.results.append({"name": name, "params": params, **stats})
+        params_text = ", ".join(f"{k}={v}" for k, v in params.items())
+        print(f"{name:<28} {params_text:<48} median={stats['median'] * 1000:10.2f} ms  min={stats['min'] * 1000:10.2f} ms",
+              flush=True)
+
+
+def _clear_data_caches(file_path, sidecars=True):
+    from modules.data_cache import get_dataframe_cache, get_columnar_path
+    from modules import data_profile
+    get_dataframe_cache().clear()
+    with data_profile._profile_lock:
+        data_profile._profile_cache.clear()
+    if sidecars:
+        for path in (get_columnar_path(file_path), get_columnar_path(file_path)[:-len(".parquet")] + ".profile.json"):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+# ---------- 数据加载（与 file_selector 相同的路径） ----------
+
+@benchmark("load")
+def bench_load(recorder, datasets, args):
+    from modules.data_cache import read_data_file, load_dataframe
+    from modules.ingest import ingest_data_file
+
+    for name, path in datasets.items():
+        params = {"dataset": name}
+        repeat = args.repeat
+        recorder.add("load.parse", params, measure(lambda: read_data_file(path), repeat))
+        recorder.add("load.cold", params, measure(lambda: load_dataframe(path), repeat,
+                                                   setup=lambda: _clear_data_caches(path)))
+        recorder.add("load.sidecar", params, measure(lambda: load_dataframe(path), repeat,
+                                                      setup=lambda: _clear_data_caches(path, sidecars=False)))
+        recorder.add("load.cached", params, measure(lambda: load_dataframe(path), repeat))
+        if name.endswith(".csv"):
+            recorder.add("load.ingest", params, measure(lambda: ingest_data_file(path), repeat,
+                                                         setup=lambda: _clear_data_caches(path)))
+
+
+# ---------- 数据概况 ----------
+
+@benchmark("dataframe_info")
+def bench_dataframe_info(recorder, datasets, args):
+    from modules.data_cache import load_dataframe
+    from modules.data_profile import DEFAULT_SCHEMA_TOKEN_BUDGET
+    from modules.model_service import get_dataframe_info
+
+    for name, path in datasets.items():
+        df = load_dataframe(path)
+        params = {"dataset": name, "token_budget": DEFAULT_SCHEMA_TOKEN_BUDGET}
+
+        def run():
+            get_dataframe_info(df, path, token_budget=DEFAULT_SCHEMA_TOKEN_BUDGET)
+
+        def reset():
+            _clear_data_caches(path)
+            load_dataframe(path)
+
+        recorder.add("dataframe_info.cold", params, measure(run, args.repeat, setup=reset))
+        recorder.add("dataframe_info.warm", params, measure(run, args.repeat))
+        recorder.add("dataframe_info.no_file", {"dataset": name}, measure(lambda: get_dataframe_info(df), args.repeat))
+
+
+# ---------- 内置模板的代码执行 ----------
+
+@benchmark("execute")
+def bench_execute(recorder, datasets, args):
+    from modules.data_cache import load_dataframe
+    from modules.data_profile import get_dataset_profile
+    from modules.intent_router import route_intent
+    from modules.code_executor import execute_code_on, execute_code_inline, warm_up_executor
+
+    warm_up_executor()
+    for name, path in datasets.items():
+        df = load_dataframe(path)
+        profile = get_dataset_profile(df, path)
+        for intent, question in TEMPLATE_QUESTIONS.items():
+            match = route_intent(question, profile)
+            if match is None:
+                continue
+            params = {"dataset": name, "template": intent}
+            recorder.add("execute.pool", params,
+                         measure(lambda: execute_code_on(match["code"], "bench", df, path), args.repeat))
+            recorder.add("execute.inline", params,
+                         measure(lambda: execute_code_inline(match["code"], "bench", df), args.repeat))
+
+
+# ---------- 对话历史 ----------
+
+def _synthetic_history(n_messages):
+    history = []
+    for i in range(n_messages):
+        if i % 2 == 0:
+            history.append({"role": "user", "content": f"第{i // 2}个问题：请分析各城市的销售额", "timestamp": "2024-01-01 00:00:00"})
+        else:
+            table = pd.DataFrame({"city": ["北京", "上海", "广州"], "amount": [1.5 * i, 2.5 * i, 3.5 * i]})
+            history.append({
+                "role": "assistant",
+                "content": "分析结果如下，" * 20,
+                "timestamp": "2024-01-01 00:00:00",
+                "code": "result_df = df.groupby('city')['amount'].sum().reset_index()",
+                "execution_result": {"output": "", "error": None, "result": {"type": "dataframe", "data": table}}
+            })
+    return history
+
+
+@benchmark("history")
+def bench_history(recorder, datasets, args):
+    from modules.data_manager import (
+        save_conversation_history, load_conversation_history, append_conversation_message
+    )
+
+    st.session_state.username = "bench"
+    for size in HISTORY_SIZES:
+        conv_id = f"history_{size}"
+        history = _synthetic_history(size)
+        params = {"messages": size}
+        recorder.add("history.save", params, measure(lambda: save_conversation_history(conv_id, history), args.repeat))
+        recorder.add("history.load", params, measure(lambda: load_conversation_history(conv_id), args.repeat))
+
+        # 追加一轮问答（用户消息 + 带结果表格的助手消息）
+        turn = _synthetic_history(2)
+
+        def append_turn():
+            for message in turn:
+                append_conversation_message(conv_id, message)
+
+        recorder.add("history.append_turn", params, measure(append_turn, args.repeat))
+
+
+# ---------- 对话列表 ----------
+
+@benchmark("list")
+def bench_list(recorder, datasets, args):
+    from modules.utils import get_user_conversation_dir
+    from modules.data_manager import list_user_conversations, count_user_conversations
+    from modules.conversation_catalog import CATALOG_FILE
+
+    username = "bench_list"
+    conv_dir = get_user_conversation_dir(username)
+    history = _synthetic_history(4)
+    for i in range(args.conversations):
+        path = os.path.join(conv_dir, f"20240101_{i:06d}.json")
+        if not os.path.exists(path):
+            history[0]["content"] = f"对话{i}：请分析各城市的销售额"
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(history, f, ensure_ascii=False, default=str)
+
+    params = {"files": args.conversations}
+    catalog_path = os.path.join(conv_dir, CATALOG_FILE)
+
+    def drop_catalog():
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(catalog_path + suffix):
+                os.remove(catalog_path + suffix)
+
+    # 首次打开需要从对话文件建立索引
+    recorder.add("list.build_catalog", params,
+                 measure(lambda: list_user_conversations(username, limit=20), max(1, args.repeat // 2), setup=drop_catalog))
+    recorder.add("list.all", params, measure(lambda: list_user_conversations(username), args.repeat))
+    recorder.add("list.page", params, measure(lambda: list_user_conversations(username, limit=20, offset=100), args.repeat))
+    recorder.add("list.search", params,
+                 measure(lambda: list_user_conversations(username, limit=20, search="对话12"), args.repeat))
+    recorder.add("list.count", params, measure(lambda: count_user_conversations(username), args.repeat))
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ChatAnalyst 热点路径基准测试")
+    parser.add_argument("--scale", type=float, default=1.0, help="数据集行数的缩放比例（列数不变）")
+    parser.add_argument("--repeat", type=int, default=5, help="每项基准的重复次数")
+    parser.add_argument("--only", nargs="*", choices=list(BENCHMARKS), help="只运行指定的基准组")
+    parser.add_argument("--datasets", nargs="*", help="只使用指定的数据集文件名")
+    parser.add_argument("--conversations", type=int, default=CONVERSATION_FILES, help="对话列表基准的对话文件数")
+    parser.add_argument("--data-dir", help="合成数据集目录（默认 benchmarks/.data/scale_<scale>，可跨运行复用）")
+    parser.add_argument("--workdir", help="运行目录（对话、缓存等文件写在这里，默认使用临时目录）")
+    parser.add_argument("--output", help="结果 JSON 文件路径（默认 benchmarks/results/<时间>.json）")
+    args = parser.parse_args(argv)
+
+    data_dir = os.path.abspath(args.data_dir or os.path.join(REPO_ROOT, "benchmarks", ".data", f"scale_{args.scale:g}"))
+    output = os.path.abspath(args.output or os.path.join(
+        REPO_ROOT, "benchmarks", "results", f"{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    ))
+    workdir = args.workdir or tempfile.mkdtemp(prefix="chatanalyst_bench_")
+    cleanup = args.workdir is None
+
+    print(f"生成数据集: {data_dir}", flush=True)
+    datasets = build_datasets(data_dir, args.scale, args.datasets)
+
+    # 项目使用相对路径保存对话、缓存和图表，在独立目录中运行避免影响真实数据
+    original_cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        from modules.utils import create_directories
+        create_directories()
+        # 数据文件复制到运行目录，列式副本等附属文件不写入数据集目录
+        local = {}
+        for name, path in datasets.items():
+            local[name] = os.path.join("data", name)
+            shutil.copy2(path, local[name])
+
+        recorder = Recorder()
+        for group, fn in BENCHMARKS.items():
+            if args.only and group not in args.only:
+                continue
+            fn(recorder, local, args)
+    finally:
+        os.chdir(original_cwd)
+        if cleanup:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "pandas": pd.__version__,
+            "scale": args.scale,
+            "repeat": args.repeat
+        },
+        "results": recorder.results
+    }
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入: {output}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
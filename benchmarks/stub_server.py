@@ -0,0 +1,169 @@
+"""本地 OpenAI 兼容的模型桩服务，用于压测时代替真实的推理集群
+
+用法:
+    python -m benchmarks.stub_server --port 8001 --latency 0.5 --tokens-per-second 50
+
+支持 POST /v1/chat/completions（含 stream=true 的 SSE 流式输出）和 GET /v1/models。
+代码生成请求返回一段可在数据框上执行的 Python 代码，其他请求返回固定长度的文本。
+"""
+import json
+import time
+import uuid
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# 返回的分析代码（只使用数值列，适用于任意数据集）
+STUB_CODE = """```python
+numeric_df = df.select_dtypes(include=['number'])
+result_df = numeric_df.describe().T
+print(result_df.head())
+```"""
+
+# 代码生成请求的特征（与 prompt_builder.CODE_INSTRUCTION 一致）
+CODE_REQUEST_MARKER = "请生成Python代码"
+
+
+class StubSettings:
+    def __init__(self, latency=0.5, tokens_per_second=50.0, response_tokens=60, model="stub-model"):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.response_tokens = response_tokens
+        self.model = model
+        self.requests = 0
+        self.lock = threading.Lock()
+
+
+def _response_pieces(messages, settings):
+    """返回逐个输出的文本片段（每个片段视为一个token）"""
+    last_user = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+    if CODE_REQUEST_MARKER in last_user:
+        return [line + "\n" for line in STUB_CODE.split("\n")]
+    return [f"分析{i}，" for i in range(settings.response_tokens)]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    settings = StubSettings()
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": self.settings.model, "object": "model"}]})
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": {"message": "invalid json"}})
+            return
+
+        settings = self.settings
+        with settings.lock:
+            settings.requests += 1
+        pieces = _response_pieces(request.get("messages", []), settings)
+        max_tokens = request.get("max_tokens")
+        if max_tokens:
+            pieces = pieces[:max_tokens]
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        model = request.get("model") or settings.model
+        interval = 1.0 / settings.tokens_per_second if settings.tokens_per_second > 0 else 0.0
+
+        time.sleep(settings.latency)
+        if not request.get("stream"):
+            time.sleep(interval * len(pieces))
+            self._send_json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(pieces)},
+                    "finish_reason": "stop"
+                }],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(pieces), "total_tokens": len(pieces)}
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+
+        def send_chunk(delta, finish_reason=None):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            }
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        try:
+            send_chunk({"role": "assistant", "content": ""})
+            for piece in pieces:
+                time.sleep(interval)
+                send_chunk({"content": piece})
+            send_chunk({}, "stop")
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        self.close_connection = True
+
+
+# 启动桩服务，返回服务对象（在后台线程中运行）
+def start_stub_server(host="127.0.0.1", port=0, settings=None):
+    handler = type("ConfiguredStubHandler", (StubHandler,), {"settings": settings or StubSettings()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="stub-server", daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="OpenAI 兼容的本地模型桩服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.5, help="首个token前的延迟（秒）")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0, help="流式输出速率")
+    parser.add_argument("--response-tokens", type=int, default=60, help="文本回复的token数")
+    parser.add_argument("--model", default="stub-model")
+    args = parser.parse_args(argv)
+
+    settings = StubSettings(args.latency, args.tokens_per_second, args.response_tokens, args.model)
+    handler = type("ConfiguredStubHandler", (StubHandler,), {"settings": settings})
+    server = ThreadingHTTPServer((args.host, args.port), handler)
+    server.daemon_threads = True
+    print(f"模型桩服务: http://{args.host}:{server.server_address[1]}/v1", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,30 +2,91 @@ import streamlit as st
 import hashlib
 import json
 import os
+import sqlite3
+import threading
 from datetime import datetime
 
-# 用户数据文件
-USER_DB_FILE = "users/users.json"
+# 用户数据库（旧版本的用户数据保存在 users.json 中，首次打开数据库时自动迁移）
+USER_DB_FILE = "users/users.db"
+LEGACY_USER_FILE = "users/users.json"
 
-# 确保用户数据文件存在
-def ensure_user_db():
-    if not os.path.exists(USER_DB_FILE):
-        with open(USER_DB_FILE, 'w') as f:
-            json.dump({}, f)
+# 数据库结构和迁移只需在进程中检查一次
+_schema_ready = False
+_schema_lock = threading.Lock()
 
-# 获取所有用户
-def get_users():
-    ensure_user_db()
-    with open(USER_DB_FILE, 'r') as f:
+# 打开数据库连接（每次调用使用一个短期连接，用完即关闭）
+def _connect():
+    global _schema_ready
+    os.makedirs(os.path.dirname(USER_DB_FILE), exist_ok=True)
+    conn = sqlite3.connect(USER_DB_FILE, timeout=10)
+    if not _schema_ready:
+        with _schema_lock:
+            if not _schema_ready:
+                try:
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.execute("""
+                        CREATE TABLE IF NOT EXISTS users (
+                            username TEXT PRIMARY KEY,
+                            password_hash TEXT NOT NULL,
+                            created_at TEXT,
+                            last_login TEXT
+                        )
+                    """)
+                    conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+                    conn.commit()
+                    _migrate_legacy_users(conn)
+                except Exception:
+                    conn.close()
+                    raise
+                _schema_ready = True
+    return conn
+
+def _legacy_users_migrated(conn):
+    return conn.execute("SELECT 1 FROM meta WHERE key = 'legacy_users_migrated'").fetchone() is not None
+
+# 一次性迁移：导入 users.json 中的用户，完成后在数据库中记录（不修改 users.json）
+def _migrate_legacy_users(conn):
+    if _legacy_users_migrated(conn):
+        return
+    # 写锁保证多个进程同时启动时只迁移一次，持锁后再次检查
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if _legacy_users_migrated(conn):
+            conn.rollback()
+            return
         try:
-            return json.load(f)
-        except json.JSONDecodeError:
-            return {}
+            with open(LEGACY_USER_FILE, 'r') as f:
+                users = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            users = {}
+        conn.executemany(
+            "INSERT OR IGNORE INTO users (username, password_hash, created_at, last_login) VALUES (?, ?, ?, ?)",
+            [
+                (username, info["password_hash"], info.get("created_at"), info.get("last_login"))
+                for username, info in users.items()
+            ]
+        )
+        conn.execute(
+            "INSERT INTO meta (key, value) VALUES ('legacy_users_migrated', ?)",
+            (datetime.now().strftime("%Y-%m-%d %H:%M:%S"),)
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
 
-# 保存用户数据
-def save_users(users):
-    with open(USER_DB_FILE, 'w') as f:
-        json.dump(users, f, indent=2)
+# 获取单个用户，不存在时返回 None
+def get_user(username):
+    conn = _connect()
+    try:
+        row = conn.execute(
+            "SELECT password_hash, created_at, last_login FROM users WHERE username = ?", (username,)
+        ).fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        return None
+    return {"password_hash": row[0], "created_at": row[1], "last_login": row[2]}
 
 # 密码哈希
 def hash_password(password):
@@ -33,33 +94,40 @@ def hash_password(password):
 
 # 注册新用户
 def register_user(username, password):
-    users = get_users()
-    
-    if username in users:
+    conn = _connect()
+    try:
+        with conn:
+            conn.execute(
+                "INSERT INTO users (username, password_hash, created_at, last_login) VALUES (?, ?, ?, NULL)",
+                (username, hash_password(password), datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+            )
+    except sqlite3.IntegrityError:
         return False, "用户名已存在"
+    finally:
+        conn.close()
     
-    users[username] = {
-        "password_hash": hash_password(password),
-        "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        "last_login": None
-    }
-    
-    save_users(users)
     return True, "注册成功"
 
 # 验证用户登录
 def authenticate_user(username, password):
-    users = get_users()
+    user = get_user(username)
     
-    if username not in users:
+    if user is None:
         return False, "用户名不存在"
     
-    if users[username]["password_hash"] != hash_password(password):
+    if user["password_hash"] != hash_password(password):
         return False, "密码错误"
     
-    # 更新最后登录时间
-    users[username]["last_login"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    save_users(users)
+    # 更新最后登录时间（只更新该用户这一行）
+    conn = _connect()
+    try:
+        with conn:
+            conn.execute(
+                "UPDATE users SET last_login = ? WHERE username = ?",
+                (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), username)
+            )
+    finally:
+        conn.close()
     
     return True, "登录成功"
 
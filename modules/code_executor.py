@@ -4,12 +4,71 @@ import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 import io
-import time
+import os
 from contextlib import redirect_stdout
 from modules.utils import get_user_id
+from modules.data_cache import get_fresh_columnar_path, private_copy
+from modules.executor_pool import run_in_pool, get_executor_pool
+from modules.intent_router import route_intent
+from modules.figure_store import save_figure
+from modules.execution_stats import ExecutionMeter
+from modules.sql_engine import open_connection, create_views, make_sql_helper
+from modules import metrics
 
-# 执行代码并捕获输出
+# 代码执行方式：process 为独立工作进程执行，inline 为在当前进程中执行
+EXECUTOR_MODE = os.environ.get("CHATANALYST_EXECUTOR_MODE", "process")
+
+# 预热代码执行进程池
+def warm_up_executor():
+    if EXECUTOR_MODE == "process":
+        get_executor_pool()
+
+# 执行代码并捕获输出（使用当前会话的数据）
 def execute_code(code, user_id):
+    return execute_code_on(
+        code,
+        user_id,
+        st.session_state.current_df,
+        st.session_state.data_files.get(st.session_state.current_file_name)
+    )
+
+# 对指定数据执行代码，不依赖会话状态，可在后台线程中调用（tables 为 SQL 引擎的数据表）
+def execute_code_on(code, user_id, df, file_path=None, tables=None):
+    with metrics.stage("execute_code", mode=EXECUTOR_MODE):
+        if EXECUTOR_MODE == "process":
+            # 优先让工作进程直接读取列式副本，避免传输数据框
+            parquet_path = None
+            if df is not None and file_path and os.path.exists(file_path):
+                parquet_path = get_fresh_columnar_path(file_path)
+            execution_result = run_in_pool(code, user_id, df=df, parquet_path=parquet_path, tables=tables)
+        else:
+            execution_result = execute_code_inline(code, user_id, df, tables)
+    
+    record_execution_metrics(execution_result)
+    return execution_result
+
+# 将单次执行的资源统计计入指标和本轮对话日志
+def record_execution_metrics(execution_result):
+    stats = execution_result.get("stats")
+    if not stats or not metrics.enabled():
+        return
+    status = "error" if execution_result["error"] else "ok"
+    metrics.inc("executions_total", help="代码执行次数", mode=EXECUTOR_MODE, status=status)
+    if "cpu_seconds" in stats:
+        metrics.observe("execution_cpu_seconds", stats["cpu_seconds"], help="代码执行占用的CPU时间")
+    if "memory_bytes" in stats:
+        metrics.observe("execution_memory_bytes", stats["memory_bytes"], help="代码执行的内存增长",
+                        buckets=metrics.SIZE_BUCKETS)
+    if "output_bytes" in stats:
+        metrics.observe("execution_output_bytes", stats["output_bytes"], help="结果表格或图表的大小",
+                        buckets=metrics.SIZE_BUCKETS, kind="dataframe")
+    if stats.get("figure_bytes"):
+        metrics.observe("execution_output_bytes", stats["figure_bytes"], help="结果表格或图表的大小",
+                        buckets=metrics.SIZE_BUCKETS, kind="figure")
+    metrics.annotate(execution=stats)
+
+# 在当前进程中执行代码
+def execute_code_inline(code, user_id, df, tables=None):
     # 创建一个临时的输出缓冲区
     output_buffer = io.StringIO()
     result = None
@@ -22,25 +81,38 @@ def execute_code(code, user_id):
         'plt': plt,
         'sns': sns,
         'st': st,
-        'df': st.session_state.current_df
+        # 数据框由所有会话共用（见 DataFrameCache），分析代码只能修改副本
+        'df': private_copy(df)
     }
+    con = None
+    if tables:
+        con = open_connection()
+        create_views(con, tables)
+        local_vars['sql'] = make_sql_helper(con)
+    
+    # 应用进程中同时运行着其他会话，只统计当前线程的CPU时间
+    meter = ExecutionMeter(exclusive=False)
     
     # 重定向标准输出
     with redirect_stdout(output_buffer):
         try:
-            # 执行代码
-            exec(code, local_vars)
-            # 检查是否有图表生成
-            if 'plt' in local_vars and plt.get_fignums():
-                fig_path = f"temp/{user_id}_{time.time()}.png"
-                plt.savefig(fig_path)
-                plt.close()
-                result = {"type": "figure", "path": fig_path}
-            # 检查是否有返回的DataFrame
-            elif 'result_df' in local_vars and isinstance(local_vars['result_df'], pd.DataFrame):
-                result = {"type": "dataframe", "data": local_vars['result_df']}
+            with meter:
+                # 执行代码
+                exec(code, local_vars)
+                figure_count = len(plt.get_fignums())
+                # 检查是否有图表生成
+                if 'plt' in local_vars and figure_count:
+                    result = save_figure(plt.gcf())
+                    plt.close()
+                # 检查是否有返回的DataFrame
+                elif 'result_df' in local_vars and isinstance(local_vars['result_df'], pd.DataFrame):
+                    result = {"type": "dataframe", "data": local_vars['result_df']}
+            meter.record_result(result, figure_count)
         except Exception as e:
             error = str(e)
+        finally:
+            if con is not None:
+                con.close()
     
     # 获取输出
     output = output_buffer.getvalue()
@@ -48,56 +120,13 @@ def execute_code(code, user_id):
     return {
         "output": output,
         "result": result,
-        "error": error
+        "error": error,
+        "stats": meter.stats
     }
 
-# 根据用户输入生成分析代码
-def generate_analysis_code(user_input):
-    if "描述" in user_input or "统计" in user_input:
-        code = """
-# 生成数据描述统计
-result_df = df.describe()
-print("数据描述统计:")
-print(result_df)
-"""
-    elif "相关" in user_input:
-        code = """
-# 计算相关性矩阵
-result_df = df.corr()
-print("相关性矩阵:")
-print(result_df)
-
-# 绘制热力图
-plt.figure(figsize=(10, 8))
-sns.heatmap(result_df, annot=True, cmap='coolwarm', fmt='.2f')
-plt.title('特征相关性热力图')
-plt.tight_layout()
-"""
-    elif "直方图" in user_input or "分布" in user_input:
-        code = """
-# 选择数值列
-numeric_cols = df.select_dtypes(include=['number']).columns[:4]  # 限制为前4列以避免图表过多
-
-# 绘制直方图
-plt.figure(figsize=(12, 10))
-for i, col in enumerate(numeric_cols, 1):
-    plt.subplot(2, 2, i)
-    sns.histplot(df[col], kde=True)
-    plt.title(f'{col} 分布')
-plt.tight_layout()
-"""
-    else:
-        code = """
-# 基本数据信息
-print("数据基本信息:")
-print(f"行数: {df.shape[0]}, 列数: {df.shape[1]}")
-print("\\n列名:", df.columns.tolist())
-print("\\n数据类型:")
-print(df.dtypes)
-print("\\n缺失值统计:")
-print(df.isnull().sum())
-
-# 生成简单的数据摘要
-result_df = df.describe().T
-"""
-    return code 
\ No newline at end of file
+# 根据用户输入生成分析代码（本地模板，未匹配时返回数据概览代码）
+def generate_analysis_code(user_input, profile=None):
+    match = route_intent(user_input, profile, threshold=0)
+    if match is None:
+        match = route_intent("概览", profile)
+    return match["code"]
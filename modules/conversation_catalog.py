@@ -0,0 +1,196 @@
+import os
+import time
+import sqlite3
+from datetime import datetime
+from modules.utils import get_user_conversation_dir
+
+# 每个用户一个目录索引库，列出对话时无需打开任何对话文件
+CATALOG_FILE = "catalog.db"
+
+# 标题截取长度
+TITLE_LENGTH = 30
+
+# 排序字段白名单
+SORT_COLUMNS = {
+    "modified": "modified",
+    "date": "date",
+    "title": "title",
+    "message_count": "message_count"
+}
+
+
+def _catalog_path(username):
+    return os.path.join(get_user_conversation_dir(username), CATALOG_FILE)
+
+
+# 打开目录索引库，尚未迁移时从已有对话文件建立索引；返回 (连接, 是否刚完成迁移)
+def _connect(username):
+    conn = sqlite3.connect(_catalog_path(username), timeout=10)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS conversations (
+            id TEXT PRIMARY KEY,
+            title TEXT,
+            date TEXT,
+            message_count INTEGER NOT NULL DEFAULT 0,
+            modified REAL NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_conversations_modified ON conversations(modified)")
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+    conn.commit()
+    if _files_migrated(conn):
+        return conn, False
+    # 写锁保证同一用户的多个会话只迁移一次，持锁后再次检查
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if _files_migrated(conn):
+            conn.rollback()
+            return conn, False
+        _migrate_conversation_files(conn, username)
+        conn.execute("INSERT INTO meta (key, value) VALUES ('files_migrated', ?)", (str(time.time()),))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        conn.close()
+        raise
+    return conn, True
+
+
+def _files_migrated(conn):
+    return conn.execute("SELECT 1 FROM meta WHERE key = 'files_migrated'").fetchone() is not None
+
+
+# 从对话ID中提取日期
+def conversation_date(conv_id):
+    if "_" in conv_id and len(conv_id.split("_")[0]) == 8:
+        try:
+            return datetime.strptime(conv_id.split("_")[0], "%Y%m%d").strftime("%Y-%m-%d")
+        except ValueError:
+            return ""
+    return ""
+
+
+# 根据第一条用户消息生成标题
+def make_title(content):
+    return content[:TITLE_LENGTH] + ("..." if len(content) > TITLE_LENGTH else "")
+
+
+def _title_from_history(history):
+    for msg in history:
+        if msg.get("role") == "user":
+            return make_title(msg["content"])
+    return None
+
+
+# 一次性迁移：扫描已有的对话文件建立索引
+def _migrate_conversation_files(conn, username):
+    from modules.data_manager import read_conversation_file, get_conversation_log_file
+
+    conv_dir = get_user_conversation_dir(username)
+    for filename in os.listdir(conv_dir):
+        if not filename.endswith('.json'):
+            continue
+        conv_id = filename[:-5]
+        file_path = os.path.join(conv_dir, filename)
+        # 单个文件出错不影响其他对话的迁移
+        try:
+            mod_time = os.path.getmtime(file_path)
+            log_path = get_conversation_log_file(file_path)
+            if os.path.exists(log_path):
+                mod_time = max(mod_time, os.path.getmtime(log_path))
+        except OSError:
+            continue
+        try:
+            history = read_conversation_file(file_path)
+            title = _title_from_history(history)
+        except Exception:
+            history, title = [], "无法读取"
+        conn.execute(
+            "INSERT OR REPLACE INTO conversations (id, title, date, message_count, modified) VALUES (?, ?, ?, ?, ?)",
+            (conv_id, title, conversation_date(conv_id), len(history), mod_time)
+        )
+
+
+# 用完整历史重置一条对话的索引（新建、清空或压缩对话时调用）
+def update_conversation(username, conv_id, history):
+    conn, _ = _connect(username)
+    try:
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO conversations (id, title, date, message_count, modified) VALUES (?, ?, ?, ?, ?)",
+                (conv_id, _title_from_history(history), conversation_date(conv_id), len(history), time.time())
+            )
+    finally:
+        conn.close()
+
+
+# 增量记录一条新消息
+def record_message(username, conv_id, message):
+    title = make_title(message["content"]) if message.get("role") == "user" else None
+    conn, migrated = _connect(username)
+    try:
+        # 刚迁移的索引已包含这条消息
+        if migrated:
+            return
+        with conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO conversations (id, title, date, message_count, modified) VALUES (?, NULL, ?, 0, ?)",
+                (conv_id, conversation_date(conv_id), time.time())
+            )
+            conn.execute(
+                "UPDATE conversations SET message_count = message_count + 1, modified = ?, "
+                "title = COALESCE(title, ?) WHERE id = ?",
+                (time.time(), title, conv_id)
+            )
+    finally:
+        conn.close()
+
+
+def _search_clause(search):
+    if not search:
+        return "", ()
+    escaped = search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return " WHERE title LIKE ? ESCAPE '\\'", (f"%{escaped}%",)
+
+
+# 查询对话列表，支持排序、分页和标题搜索
+def query_conversations(username, limit=None, offset=0, search=None, sort_by="modified", descending=True):
+    order_column = SORT_COLUMNS.get(sort_by, "modified")
+    where, params = _search_clause(search)
+    sql = (
+        f"SELECT id, title, date, message_count, modified FROM conversations{where} "
+        f"ORDER BY {order_column} {'DESC' if descending else 'ASC'}, id"
+    )
+    if limit is not None:
+        sql += " LIMIT ? OFFSET ?"
+        params = params + (limit, offset)
+
+    conn, _ = _connect(username)
+    try:
+        rows = conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+
+    return [
+        {
+            "id": row["id"],
+            "title": row["title"] or "空对话",
+            "date": row["date"],
+            "message_count": row["message_count"],
+            "modified": datetime.fromtimestamp(row["modified"]).strftime("%Y-%m-%d %H:%M:%S"),
+            "modified_timestamp": row["modified"]
+        }
+        for row in rows
+    ]
+
+
+# 统计对话数量（用于分页）
+def count_conversations(username, search=None):
+    where, params = _search_clause(search)
+    conn, _ = _connect(username)
+    try:
+        return conn.execute(f"SELECT COUNT(*) FROM conversations{where}", params).fetchone()[0]
+    finally:
+        conn.close()
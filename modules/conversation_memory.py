@@ -0,0 +1,141 @@
+import os
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from modules.model_service import generate_completion
+
+logger = logging.getLogger(__name__)
+
+# 原样保留的最近消息条数（约3轮问答）
+MEMORY_RECENT_MESSAGES = 6
+# 单条消息保留的最大字符数
+MEMORY_MESSAGE_MAX_CHARS = 2000
+# 较早消息累计到这么多条时才更新摘要
+SUMMARY_REFRESH_BATCH = 4
+# 尚未纳入摘要的消息最多原样保留的条数（摘要还没生成的长对话）
+MEMORY_MAX_UNSUMMARIZED = MEMORY_RECENT_MESSAGES + 4 * SUMMARY_REFRESH_BATCH
+# 摘要的最大生成长度
+SUMMARY_MAX_TOKENS = 400
+
+SUMMARY_PROMPT = (
+    "你负责维护一段数据分析对话的摘要。请把已有摘要和新增的对话内容合并为一段新的摘要，"
+    "保留用户关注的数据、字段、分析结论和未解决的问题，不超过300字。只输出摘要本身。"
+)
+
+# 摘要在后台单线程更新，不占用请求路径
+_summary_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="summary")
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+# 对话摘要文件路径（与对话快照文件放在一起）
+def get_summary_file(conversation_file):
+    return conversation_file[:-len(".json")] + ".summary"
+
+
+def load_summary(summary_file):
+    if not os.path.exists(summary_file):
+        return {"summary": "", "covered": 0}
+    try:
+        with open(summary_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"summary": "", "covered": 0}
+
+
+def _save_summary(summary_file, summary):
+    tmp_path = summary_file + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False)
+    os.replace(tmp_path, summary_file)
+
+
+# 删除对话摘要（对话被清空时）
+def clear_summary(summary_file):
+    if os.path.exists(summary_file):
+        os.remove(summary_file)
+
+
+def _truncate(content):
+    if len(content) <= MEMORY_MESSAGE_MAX_CHARS:
+        return content
+    return content[:MEMORY_MESSAGE_MAX_CHARS] + "...（内容过长已截断）"
+
+
+def _context_messages(history):
+    return [
+        {"role": msg["role"], "content": _truncate(msg["content"])}
+        for msg in history
+        if msg["role"] in ["user", "assistant", "system"]
+    ]
+
+
+# 构建传给模型的对话上下文：较早消息的摘要 + 摘要之后的所有消息原文
+def build_memory_context(summary_file, history):
+    """摘要之后、最近几条之前尚未纳入摘要的消息同样原样保留，上下文长度有上限"""
+    summary = load_summary(summary_file)
+    # 对话被清空后旧摘要失效
+    covered = 0
+    if summary["summary"] and summary["covered"] <= max(len(history) - MEMORY_RECENT_MESSAGES, 0):
+        covered = summary["covered"]
+    
+    context = []
+    if covered:
+        context.append({"role": "system", "content": f"此前对话摘要:\n{summary['summary']}"})
+    start = max(covered, len(history) - MEMORY_MAX_UNSUMMARIZED)
+    if start > covered:
+        context.append({"role": "system", "content": f"（更早的 {start - covered} 条消息尚未纳入摘要，已省略）"})
+    return context + _context_messages(history[start:])
+
+
+def _format_messages(messages):
+    role_names = {"user": "用户", "assistant": "助手", "system": "系统"}
+    return "\n".join(f"{role_names.get(msg['role'], msg['role'])}: {_truncate(msg['content'])}" for msg in messages)
+
+
+def _refresh_summary(summary_file, older, config):
+    try:
+        summary = load_summary(summary_file)
+        if summary["covered"] > len(older):
+            summary = {"summary": "", "covered": 0}
+        new_messages = older[summary["covered"]:]
+        if not new_messages:
+            return
+
+        content = generate_completion(
+            [
+                {"role": "system", "content": SUMMARY_PROMPT},
+                {"role": "user", "content": f"已有摘要:\n{summary['summary'] or '（无）'}\n\n新增对话:\n{_format_messages(new_messages)}"}
+            ],
+            config, kind="summary", temperature=0, max_tokens=SUMMARY_MAX_TOKENS
+        )
+        if not content:
+            return
+        _save_summary(summary_file, {
+            "summary": content.strip(),
+            "covered": len(older)
+        })
+    except Exception:
+        logger.exception("更新对话摘要失败: %s", summary_file)
+    finally:
+        with _pending_lock:
+            _pending.discard(summary_file)
+
+
+# 在后台更新对话摘要（较早消息积累到一定数量时）
+def schedule_summary_refresh(summary_file, history, config):
+    older = [
+        {"role": msg["role"], "content": msg["content"]}
+        for msg in history[:max(len(history) - MEMORY_RECENT_MESSAGES, 0)]
+        if msg["role"] in ["user", "assistant", "system"]
+    ]
+    summary = load_summary(summary_file)
+    if summary["covered"] <= len(older) and len(older) - summary["covered"] < SUMMARY_REFRESH_BATCH:
+        return
+
+    with _pending_lock:
+        if summary_file in _pending:
+            return
+        _pending.add(summary_file)
+    _summary_executor.submit(_refresh_summary, summary_file, older, config)
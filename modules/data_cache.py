@@ -0,0 +1,187 @@
+import os
+import threading
+from collections import OrderedDict
+import pandas as pd
+from modules.utils import get_sidecar_path
+from modules.metrics import register_collector
+
+try:
+    import pyarrow  # noqa: F401
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+# 数据框缓存的内存上限（MB），可通过环境变量调整
+DATAFRAME_CACHE_MAX_MB = int(os.environ.get("CHATANALYST_DF_CACHE_MB", "1024"))
+
+
+# 进程级数据框缓存
+class DataFrameCache:
+    """按 (路径, 大小, 修改时间) 缓存已解析的数据框，超出内存预算时按LRU淘汰"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, df):
+        size = int(df.memory_usage(deep=True).sum())
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+            # 单个数据框超出预算时不缓存
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (df, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes and self._entries:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+    def invalidate(self, path):
+        """移除某个文件的所有缓存版本"""
+        path = os.path.abspath(path)
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == path]:
+                self.current_bytes -= self._entries.pop(key)[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+
+_dataframe_cache = DataFrameCache(DATAFRAME_CACHE_MAX_MB * 1024 * 1024)
+
+
+def _collect_metrics():
+    stats = _dataframe_cache.stats()
+    return [
+        ("dataframe_cache_hits_total", "counter", {}, stats["hits"]),
+        ("dataframe_cache_misses_total", "counter", {}, stats["misses"]),
+        ("dataframe_cache_evictions_total", "counter", {}, stats["evictions"]),
+        ("dataframe_cache_bytes", "gauge", {}, stats["bytes"]),
+        ("dataframe_cache_entries", "gauge", {}, stats["entries"])
+    ]
+
+
+register_collector(_collect_metrics)
+
+
+def get_dataframe_cache():
+    return _dataframe_cache
+
+
+# 生成缓存键
+def file_cache_key(file_path):
+    stat = os.stat(file_path)
+    return (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+
+
+# 按文件类型解析数据
+def read_data_file(file_path):
+    if file_path.endswith('.csv'):
+        return pd.read_csv(file_path)
+    elif file_path.endswith(('.xlsx', '.xls')):
+        return pd.read_excel(file_path)
+    raise ValueError(f"不支持的文件格式: {os.path.basename(file_path)}")
+
+
+# 列式副本路径
+def get_columnar_path(file_path):
+    return get_sidecar_path(file_path, ".parquet")
+
+
+# 写入Parquet列式副本，之后的读取无需重新解析文本
+def write_columnar_sidecar(file_path, df):
+    if not HAS_PYARROW:
+        return None
+    sidecar_path = get_columnar_path(file_path)
+    tmp_path = sidecar_path + ".tmp"
+    try:
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, sidecar_path)
+        return sidecar_path
+    except Exception:
+        # 列名或混合类型列无法转换时保留原文件即可
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
+
+
+# 获取未过期的列式副本路径（副本早于原文件时视为过期）
+def get_fresh_columnar_path(file_path):
+    if not HAS_PYARROW:
+        return None
+    sidecar_path = get_columnar_path(file_path)
+    if not os.path.exists(sidecar_path) or os.path.getmtime(sidecar_path) < os.path.getmtime(file_path):
+        return None
+    return sidecar_path
+
+
+# 读取列式副本（以内存映射方式打开，多个会话可通过系统页缓存共享）
+def read_columnar_sidecar(file_path):
+    sidecar_path = get_fresh_columnar_path(file_path)
+    if sidecar_path is None:
+        return None
+    try:
+        return pd.read_parquet(sidecar_path, memory_map=True)
+    except Exception:
+        return None
+
+
+# 读取数据文件（优先使用缓存，其次使用列式副本）
+def load_dataframe(file_path):
+    key = file_cache_key(file_path)
+    df = _dataframe_cache.get(key)
+    if df is None:
+        df = read_columnar_sidecar(file_path)
+        if df is None:
+            df = read_data_file(file_path)
+            write_columnar_sidecar(file_path, df)
+        _dataframe_cache.put(key, df)
+    return df
+
+
+# 分析代码使用的数据框副本，代码中的修改不会影响缓存中（其他会话共用）的数据框
+def private_copy(df):
+    """启用写时复制（pandas 3 默认启用）时浅拷贝即可隔离修改，否则需要深拷贝"""
+    if df is None:
+        return None
+    if int(pd.__version__.split(".")[0]) >= 3 or pd.get_option("mode.copy_on_write") is True:
+        return df.copy(deep=False)
+    return df.copy()
+
+
+# 将已解析的数据框放入缓存（可选写入列式副本），避免刚写入的文件被再次读取
+def cache_dataframe(file_path, df, write_sidecar=True):
+    if write_sidecar:
+        write_columnar_sidecar(file_path, df)
+    _dataframe_cache.invalidate(file_path)
+    _dataframe_cache.put(file_cache_key(file_path), df)
@@ -5,74 +5,145 @@ import json
 from datetime import datetime
 import os
 import shutil
+import threading
 from modules.utils import (
-    get_user_id, get_user_data_dir, get_user_conversation_file, 
-    get_user_conversation_dir, generate_conversation_id, get_file_path
+    get_user_id, get_user_data_dir, get_user_conversation_file, get_conversation_file,
+    generate_conversation_id, get_file_path
 )
+from modules.data_cache import load_dataframe, cache_dataframe
+from modules.ingest import ingest_data_file
+from modules.sql_engine import convert_to_parquet, get_table_sources, preview_table
+from modules import metrics
+from modules.figure_store import add_figure_references, set_figure_references, message_figure_ids
+from modules.conversation_catalog import (
+    query_conversations, count_conversations, update_conversation, record_message
+)
+
+# 侧边栏数据预览的最大行数
+PREVIEW_ROWS = 100
+
+# 对话日志达到快照长度（且不少于该行数）时才压缩，保证追加消息的均摊I/O为O(1)
+LOG_COMPACT_MIN_LINES = 50
+
+# 追加日志与压缩的进程内锁，以及各日志文件的当前行数和各快照的消息数
+_history_lock = threading.Lock()
+_log_line_counts = {}
+_snapshot_lengths = {}
 
 # 对话历史管理
+# 每个对话由快照文件 <id>.json 和追加日志 <id>.jsonl 组成，读取时将日志中的消息追加到快照之后
+def get_conversation_log_file(snapshot_path):
+    return snapshot_path[:-len(".json")] + ".jsonl"
+
+def _json_default(obj):
+    # 执行结果中的数据框按 split 格式保存，显示时再还原
+    if isinstance(obj, pd.DataFrame):
+        return json.loads(obj.to_json(orient="split", date_format="iso", force_ascii=False))
+    if isinstance(obj, np.generic):
+        return obj.item()
+    return str(obj)
+
+def read_conversation_file(snapshot_path):
+    # 修复日志末尾和更新计数时持有锁，避免截掉其他线程正在写入的行
+    with _history_lock:
+        return _read_conversation_file(snapshot_path)
+
+def _read_conversation_file(snapshot_path):
+    """调用方需持有 _history_lock"""
+    history = []
+    if os.path.exists(snapshot_path):
+        with open(snapshot_path, 'r', encoding='utf-8') as f:
+            history = json.load(f)
+        _snapshot_lengths[snapshot_path] = len(history)
+    
+    log_path = get_conversation_log_file(snapshot_path)
+    log_lines = 0
+    if os.path.exists(log_path):
+        valid_bytes = 0
+        with open(log_path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    history.append(json.loads(line.decode('utf-8')))
+                except ValueError:
+                    break
+                valid_bytes += len(line)
+                log_lines += 1
+        # 崩溃时写了一半的最后一行直接截掉，避免之后追加的消息无法读取
+        if valid_bytes < os.path.getsize(log_path):
+            with open(log_path, 'r+b') as f:
+                f.truncate(valid_bytes)
+    _log_line_counts[log_path] = log_lines
+    return history
+
+def _write_snapshot(snapshot_path, history):
+    # 先写临时文件再原子替换，写入中途崩溃不会损坏已有快照
+    tmp_path = snapshot_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(history, f, ensure_ascii=False, default=_json_default)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, snapshot_path)
+    _snapshot_lengths[snapshot_path] = len(history)
+    
+    log_path = get_conversation_log_file(snapshot_path)
+    if os.path.exists(log_path):
+        os.remove(log_path)
+    _log_line_counts[log_path] = 0
+
 def load_conversation_history(user_id):
-    file_path = get_user_conversation_file(user_id)
-    if os.path.exists(file_path):
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return []
+    return read_conversation_file(get_user_conversation_file(user_id))
 
 def save_conversation_history(user_id, history):
-    file_path = get_user_conversation_file(user_id)
-    with open(file_path, 'w', encoding='utf-8') as f:
-        json.dump(history, f, ensure_ascii=False, indent=2)
-
-# 列出用户的所有对话历史
-def list_user_conversations(username):
-    conv_dir = get_user_conversation_dir(username)
-    if not os.path.exists(conv_dir):
-        return []
-    
-    conversations = []
-    for filename in os.listdir(conv_dir):
-        if filename.endswith('.json'):
-            conv_id = filename[:-5]  # 移除 .json 后缀
-            file_path = os.path.join(conv_dir, filename)
-            
-            # 获取文件修改时间
-            mod_time = os.path.getmtime(file_path)
-            mod_time_str = datetime.fromtimestamp(mod_time).strftime("%Y-%m-%d %H:%M:%S")
-            
-            # 读取对话内容获取第一条消息作为标题
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    conv_data = json.load(f)
-                    title = "空对话"
-                    if conv_data and len(conv_data) > 0:
-                        for msg in conv_data:
-                            if msg["role"] == "user":
-                                title = msg["content"][:30] + ("..." if len(msg["content"]) > 30 else "")
-                                break
-            except:
-                title = "无法读取"
+    snapshot_path = get_user_conversation_file(user_id)
+    with metrics.stage("history_save"), _history_lock:
+        _write_snapshot(snapshot_path, history)
+    set_figure_references(snapshot_path, message_figure_ids(history))
+    if 'username' in st.session_state:
+        update_conversation(st.session_state.username, user_id, history)
+
+def append_conversation_message(user_id, message):
+    """追加一条消息到对话日志"""
+    _append_to_conversation_file(get_user_conversation_file(user_id), message)
+
+def _append_to_conversation_file(snapshot_path, message):
+    with metrics.stage("history_append"):
+        log_path = get_conversation_log_file(snapshot_path)
+        line = json.dumps(message, ensure_ascii=False, default=_json_default)
+        add_figure_references(snapshot_path, message_figure_ids([message]))
+        
+        with _history_lock:
+            if log_path not in _log_line_counts:
+                # 还没有快照的对话直接写入快照，保证对话列表能找到它
+                if not os.path.exists(snapshot_path):
+                    _write_snapshot(snapshot_path, _read_conversation_file(snapshot_path) + [message])
+                    return
+                if os.path.exists(log_path):
+                    with open(log_path, 'r', encoding='utf-8') as f:
+                        _log_line_counts[log_path] = sum(1 for _ in f)
+                else:
+                    _log_line_counts[log_path] = 0
             
-            # 从对话ID中提取日期
-            date_part = ""
-            if "_" in conv_id and len(conv_id.split("_")[0]) == 8:
-                date_str = conv_id.split("_")[0]
-                try:
-                    date_obj = datetime.strptime(date_str, "%Y%m%d")
-                    date_part = date_obj.strftime("%Y-%m-%d")
-                except:
-                    date_part = ""
+            log_lines = _log_line_counts[log_path] + 1
+            snapshot_messages = _snapshot_lengths.get(snapshot_path)
+            if log_lines >= LOG_COMPACT_MIN_LINES and (snapshot_messages is None or log_lines >= snapshot_messages):
+                # 压缩时从磁盘上的快照和日志重建完整历史；会话中的历史可能缺少后台任务追加的消息
+                history = _read_conversation_file(snapshot_path) + [message]
+                if log_lines >= len(history) - log_lines:
+                    _write_snapshot(snapshot_path, history)
+                    return
             
-            conversations.append({
-                "id": conv_id,
-                "title": title,
-                "date": date_part,
-                "modified": mod_time_str,
-                "modified_timestamp": mod_time
-            })
-    
-    # 按修改时间排序，最新的在前
-    conversations.sort(key=lambda x: x["modified_timestamp"], reverse=True)
-    return conversations
+            with open(log_path, 'a', encoding='utf-8') as f:
+                f.write(line + "\n")
+            _log_line_counts[log_path] = log_lines
+
+# 列出用户的所有对话历史（从目录索引查询，支持分页和标题搜索）
+def list_user_conversations(username, limit=None, offset=0, search=None, sort_by="modified"):
+    return query_conversations(username, limit=limit, offset=offset, search=search, sort_by=sort_by)
+
+def count_user_conversations(username, search=None):
+    return count_conversations(username, search=search)
 
 # 初始化会话状态
 def init_session_state():
@@ -122,7 +193,7 @@ def load_conversation(conv_id):
                 st.session_state.data_files[filename] = file_path
 
 # 对话管理
-def add_to_conversation(role, content, code=None, execution_result=None):
+def make_message(role, content, code=None, execution_result=None):
     message = {
         "role": role,
         "content": content,
@@ -134,15 +205,33 @@ def add_to_conversation(role, content, code=None, execution_result=None):
     
     if execution_result:
         message["execution_result"] = execution_result
-    
+    return message
+
+def add_to_conversation(role, content, code=None, execution_result=None):
+    message = make_message(role, content, code, execution_result)
     st.session_state.conversation_history.append(message)
-    save_conversation_history(get_user_id(), st.session_state.conversation_history)
+    append_conversation_message(get_user_id(), message)
+    if 'username' in st.session_state:
+        record_message(st.session_state.username, get_user_id(), message)
+
+# 向指定对话追加消息（不依赖会话状态，供后台任务使用）
+def add_message_to_conversation(username, conversation_id, role, content, code=None, execution_result=None):
+    message = make_message(role, content, code, execution_result)
+    _append_to_conversation_file(get_conversation_file(username, conversation_id), message)
+    if username:
+        record_message(username, conversation_id, message)
+    return message
 
 # 文件上传和处理
 def handle_file_upload():
     uploaded_file = st.file_uploader("上传数据文件", type=["csv", "xlsx", "xls"], help="支持csv、xlsx、xls格式，文件大小限制：200MB")
 
     if uploaded_file is not None:
+        # 同一个上传文件在每次重新运行时都会返回，只处理一次
+        upload_id = getattr(uploaded_file, "file_id", None) or (uploaded_file.name, uploaded_file.size)
+        if st.session_state.get("last_upload_id") == upload_id:
+            return
+        
         try:
             file_name = uploaded_file.name
             username = st.session_state.username
@@ -151,20 +240,29 @@ def handle_file_upload():
             # 使用新的文件路径结构
             file_path = get_file_path(username, conversation_id, file_name)
             
-            # 保存文件
+            # 分块保存文件，避免一次性复制整个上传内容
+            uploaded_file.seek(0)
             with open(file_path, "wb") as f:
-                f.write(uploaded_file.getbuffer())
+                shutil.copyfileobj(uploaded_file, f, 1024 * 1024)
             
-            # 根据文件类型读取数据
-            if file_name.endswith('.csv'):
-                df = pd.read_csv(file_path)
-            elif file_name.endswith(('.xlsx', '.xls')):
-                df = pd.read_excel(file_path)
+            if st.session_state.get("sql_engine"):
+                # SQL 引擎模式下只转换为列式副本，不把数据读入内存
+                with st.spinner(f"正在转换 {file_name}..."), metrics.stage("file_ingest", engine="sql"):
+                    convert_to_parquet(file_path)
+                df = None
+            else:
+                # 分块解析并显示进度
+                progress_bar = st.progress(0.0, text=f"正在解析 {file_name}...")
+                with metrics.stage("file_ingest"):
+                    df = ingest_data_file(file_path, lambda p: progress_bar.progress(p, text=f"正在解析 {file_name}..."))
+                progress_bar.empty()
+                cache_dataframe(file_path, df, write_sidecar=False)
             
             # 更新会话状态
             st.session_state.data_files[file_name] = file_path
             st.session_state.current_df = df
             st.session_state.current_file_name = file_name
+            st.session_state.last_upload_id = upload_id
             
             # 添加到对话历史
             add_to_conversation("system", f"已上传文件: {file_name}")
@@ -172,8 +270,38 @@ def handle_file_upload():
         except Exception as e:
             st.error(f"文件处理错误: {str(e)}")
 
+# SQL 引擎模式下的数据表列表（只预览前几行，不加载整个文件）
+def sql_table_selector():
+    # 释放之前加载的数据框
+    st.session_state.current_df = None
+    tables = get_table_sources(st.session_state.data_files)
+    if not tables:
+        return
+    
+    options = [table["file"] for table in tables]
+    selected_file = st.selectbox(
+        "数据表",
+        options,
+        index=options.index(st.session_state.current_file_name) if st.session_state.current_file_name in options else 0,
+        format_func=lambda file: f"{tables[options.index(file)]['name']}（{file}）"
+    )
+    st.session_state.current_file_name = selected_file
+    table = tables[options.index(selected_file)]
+    
+    preview, rows = preview_table(table, PREVIEW_ROWS)
+    st.dataframe(preview)
+    if rows is None:
+        st.write(f"数据表 {table['name']}: {preview.shape[1]} 列")
+    else:
+        st.write(f"数据表 {table['name']}: {rows} 行, {preview.shape[1]} 列")
+    st.caption(f"仅预览前 {PREVIEW_ROWS} 行；分析时通过 SQL 查询全部 {len(tables)} 张数据表")
+
 # 文件选择器
 def file_selector():
+    if st.session_state.get("sql_engine"):
+        sql_table_selector()
+        return
+    
     if st.session_state.data_files:
         # 使用更简洁的选择器
         options = list(st.session_state.data_files.keys())
@@ -191,15 +319,16 @@ def file_selector():
             )
         
         if selected_file:
-            file_path = st.session_state.data_files[selected_file]
-            if selected_file.endswith('.csv'):
-                df = pd.read_csv(file_path)
-            elif selected_file.endswith(('.xlsx', '.xls')):
-                df = pd.read_excel(file_path)
-                
-            st.session_state.current_df = df
-            st.session_state.current_file_name = selected_file
+            # 已加载的文件直接复用，其他文件从进程级缓存读取
+            if selected_file != st.session_state.current_file_name or st.session_state.current_df is None:
+                file_path = st.session_state.data_files[selected_file]
+                with metrics.stage("file_load"):
+                    st.session_state.current_df = load_dataframe(file_path)
+                st.session_state.current_file_name = selected_file
+            df = st.session_state.current_df
             
-            # 显示数据预览
-            st.dataframe(df)
-            st.write(f"数据形状: {df.shape[0]} 行, {df.shape[1]} 列") 
\ No newline at end of file
+            # 只显示有限行数的预览，避免把整个数据集发送到浏览器
+            st.dataframe(df.head(PREVIEW_ROWS))
+            st.write(f"数据形状: {df.shape[0]} 行, {df.shape[1]} 列")
+            if df.shape[0] > PREVIEW_ROWS:
+                st.caption(f"仅预览前 {PREVIEW_ROWS} 行")
\ No newline at end of file
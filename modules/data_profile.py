@@ -0,0 +1,229 @@
+import os
+import re
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from modules.utils import get_sidecar_path, estimate_tokens
+
+# 数据概况在提示词中的默认token预算
+DEFAULT_SCHEMA_TOKEN_BUDGET = 3000
+# 同一命名模式下至少有这么多列才合并为一组
+COLUMN_GROUP_MIN_SIZE = 3
+# 每组列举的示例列数
+COLUMN_GROUP_EXAMPLES = 3
+
+# 内存中的数据概况缓存：文件路径 -> 概况，按最近使用淘汰（概况同时保存在附属文件中，淘汰后可快速恢复）
+PROFILE_CACHE_MAX_ENTRIES = int(os.environ.get("CHATANALYST_PROFILE_CACHE_ENTRIES", "64"))
+_profile_cache = OrderedDict()
+_profile_lock = threading.Lock()
+
+
+# 数据文件指纹，文件变化后概况自动失效
+def file_fingerprint(file_path):
+    stat = os.stat(file_path)
+    return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+
+# 计算数据概况（向量化统计）
+def compute_profile(df):
+    missing = df.isna().sum()
+    numeric_df = df.select_dtypes(include=['number'])
+
+    columns = [
+        {"name": str(col), "dtype": str(dtype), "missing": int(missing[col])}
+        for col, dtype in df.dtypes.items()
+    ]
+
+    numeric = {}
+    if numeric_df.shape[1] > 0:
+        stats = numeric_df.agg(['mean', 'min', 'max'])
+        for col in stats.columns:
+            numeric[str(col)] = {
+                "mean": float(stats.at['mean', col]),
+                "min": float(stats.at['min', col]),
+                "max": float(stats.at['max', col])
+            }
+
+    return {
+        "rows": int(df.shape[0]),
+        "cols": int(df.shape[1]),
+        "columns": columns,
+        "numeric": numeric
+    }
+
+
+# 获取数据概况，按数据文件版本缓存在内存和附属文件中
+def get_dataset_profile(df, file_path=None):
+    if not file_path or not os.path.exists(file_path):
+        return compute_profile(df)
+
+    fingerprint = file_fingerprint(file_path)
+    with _profile_lock:
+        cached = _profile_cache.get(file_path)
+        if cached is not None:
+            _profile_cache.move_to_end(file_path)
+    if cached and cached.get("fingerprint") == fingerprint:
+        return cached
+
+    profile_path = get_sidecar_path(file_path, ".profile.json")
+    profile = None
+    if os.path.exists(profile_path):
+        try:
+            with open(profile_path, 'r', encoding='utf-8') as f:
+                profile = json.load(f)
+        except (OSError, ValueError):
+            profile = None
+
+    if not profile or profile.get("fingerprint") != fingerprint:
+        profile = compute_profile(df)
+        profile["fingerprint"] = fingerprint
+        tmp_path = profile_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(profile, f, ensure_ascii=False)
+        os.replace(tmp_path, profile_path)
+
+    with _profile_lock:
+        _profile_cache[file_path] = profile
+        _profile_cache.move_to_end(file_path)
+        while len(_profile_cache) > PROFILE_CACHE_MAX_ENTRIES:
+            _profile_cache.popitem(last=False)
+    return profile
+
+
+# 数据集结构指纹：列名、类型和行数相同的数据集得到相同的指纹
+def schema_fingerprint(profile):
+    schema = [profile["rows"], [(col["name"], col["dtype"]) for col in profile["columns"]]]
+    return hashlib.sha1(json.dumps(schema, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def _column_line(col, profile):
+    line = f"- {col['name']} ({col['dtype']})"
+    stats = profile["numeric"].get(col["name"])
+    if stats:
+        line += f": 均值={stats['mean']:.2f}, 最小值={stats['min']:.2f}, 最大值={stats['max']:.2f}"
+    if col["missing"] > 0:
+        line += f", 缺失 {col['missing']} ({col['missing'] / max(profile['rows'], 1) * 100:.1f}%)"
+    return line
+
+
+def _group_line(pattern, dtype, cols, profile):
+    examples = ", ".join(col["name"] for col in cols[:COLUMN_GROUP_EXAMPLES])
+    line = f"- {pattern} ({dtype}) 共 {len(cols)} 列，如 {examples}"
+    stats = [profile["numeric"][col["name"]] for col in cols if col["name"] in profile["numeric"]]
+    if stats:
+        means = [s["mean"] for s in stats]
+        line += (
+            f": 均值范围=[{min(means):.2f}, {max(means):.2f}], "
+            f"最小值={min(s['min'] for s in stats):.2f}, 最大值={max(s['max'] for s in stats):.2f}"
+        )
+    missing = sum(col["missing"] for col in cols)
+    if missing:
+        line += f", 缺失 {missing}"
+    return line
+
+
+# 按与问题的相关度给列打分：问题中直接提到列名最高，其次是词语重叠
+def _column_relevance(name, question):
+    if not question:
+        return 0
+    if name and name in question:
+        return 2
+    words = [w for w in re.split(r"[\s_\-.]+", name.lower()) if len(w) > 1]
+    return 1 if any(w in question.lower() for w in words) else 0
+
+
+# 在token预算内渲染宽表的数据概况
+def _render_compact(profile, question, token_budget):
+    """问题中提到的列单独列出，其余列按命名模式和类型分组（与问题相关的组在前），超出预算的部分省略"""
+    mentioned = [col for col in profile["columns"] if _column_relevance(col["name"], question) == 2]
+    mentioned_names = {col["name"] for col in mentioned}
+
+    groups = {}
+    for col in profile["columns"]:
+        if col["name"] in mentioned_names:
+            continue
+        pattern = re.sub(r"\d+", "#", col["name"])
+        groups.setdefault((pattern, col["dtype"]), []).append(col)
+
+    group_entries, single_cols = [], []
+    for (pattern, dtype), cols in groups.items():
+        if len(cols) >= COLUMN_GROUP_MIN_SIZE:
+            relevance = max(_column_relevance(col["name"], question) for col in cols[:COLUMN_GROUP_EXAMPLES])
+            group_entries.append((relevance, len(cols), _group_line(pattern, dtype, cols, profile)))
+        else:
+            single_cols.extend(cols)
+    group_entries.sort(key=lambda entry: (-entry[0], -entry[1]))
+    single_cols.sort(key=lambda col: -_column_relevance(col["name"], question))
+
+    sections = [
+        ("问题中提到的列:", [(_column_line(col, profile), 1) for col in mentioned]),
+        ("列分组（# 表示数字）:", [(line, n_cols) for _, n_cols, line in group_entries]),
+        ("其他列:", [(_column_line(col, profile), 1) for col in single_cols])
+    ]
+
+    lines = [f"数据形状: {profile['rows']} 行, {profile['cols']} 列"]
+    # 每行额外计入换行符
+    used = estimate_tokens(lines[0]) + 1
+    shown = 0
+    for title, entries in sections:
+        title_tokens = estimate_tokens(title) + 1
+        for i, (line, n_cols) in enumerate(entries):
+            cost = estimate_tokens(line) + 1 + (title_tokens if i == 0 else 0)
+            if used + cost > token_budget:
+                break
+            if i == 0:
+                lines.append(title)
+            lines.append(line)
+            used += cost
+            shown += n_cols
+
+    if shown < profile["cols"]:
+        lines.append(f"（其余 {profile['cols'] - shown} 列因篇幅省略）")
+    return "\n".join(lines) + "\n"
+
+
+# 完整列出所有列的数据概况
+def _render_full(profile):
+    rows = profile["rows"]
+    lines = [f"数据形状: {rows} 行, {profile['cols']} 列", "列信息:"]
+    lines.extend(f"- {col['name']} ({col['dtype']})" for col in profile["columns"])
+
+    if profile["numeric"]:
+        lines.append("")
+        lines.append("数值列统计:")
+        lines.extend(
+            f"- {name}: 均值={stats['mean']:.2f}, 最小值={stats['min']:.2f}, 最大值={stats['max']:.2f}"
+            for name, stats in profile["numeric"].items()
+        )
+
+    missing_cols = [col for col in profile["columns"] if col["missing"] > 0]
+    if missing_cols:
+        lines.append("")
+        lines.append("缺失值信息:")
+        lines.extend(
+            f"- {col['name']}: {col['missing']} 个缺失值 ({col['missing'] / max(rows, 1) * 100:.1f}%)"
+            for col in missing_cols
+        )
+
+    return "\n".join(lines) + "\n"
+
+
+# 将数据概况渲染为提示词文本
+def render_profile(profile, question=None, token_budget=None):
+    """指定 token_budget 时，超出预算的宽表改用分组摘要，提示词长度不随列数增长"""
+    text = _render_full(profile)
+    if token_budget is None or estimate_tokens(text) <= token_budget:
+        return text
+    return _render_compact(profile, question, token_budget)
+
+
+# 渲染问题中提到的列的详细信息
+def render_question_columns(profile, question, token_budget=None):
+    """仅在数据概况为摘要形式时返回内容；完整概况已包含所有列，返回 None"""
+    if not question or token_budget is None or estimate_tokens(_render_full(profile)) <= token_budget:
+        return None
+    mentioned = [col for col in profile["columns"] if _column_relevance(col["name"], question) == 2]
+    if not mentioned:
+        return None
+    return "问题中提到的列:\n" + "\n".join(_column_line(col, profile) for col in mentioned)
@@ -0,0 +1,104 @@
+import os
+import time
+
+# 单次代码执行的资源统计：耗时、CPU时间、峰值内存、结果表格和图表的大小
+
+
+def _read_status_bytes(field):
+    """从 /proc/self/status 读取内存字段（字节），不支持时返回 None"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def _reset_peak_rss():
+    """重置当前进程的峰值常驻内存（Linux 4.0+），成功时返回 True"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+class ExecutionMeter:
+    """统计一次代码执行的资源占用
+
+    exclusive=True 表示进程只执行这一段代码（工作进程），此时统计整个进程的
+    CPU时间和峰值内存；否则（在应用进程中执行）只统计当前线程的CPU时间，
+    内存取执行前后常驻内存的差值。
+    """
+
+    def __init__(self, exclusive=True):
+        self.exclusive = exclusive
+        self.stats = {}
+
+    def __enter__(self):
+        self._peak_reset = self.exclusive and _reset_peak_rss()
+        self._rss_start = _read_status_bytes("VmRSS")
+        self._cpu_start = time.process_time() if self.exclusive else time.thread_time()
+        self._wall_start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self._wall_start
+        cpu = (time.process_time() if self.exclusive else time.thread_time()) - self._cpu_start
+        self.stats["wall_seconds"] = round(wall, 4)
+        self.stats["cpu_seconds"] = round(cpu, 4)
+
+        if self._rss_start is not None:
+            end = _read_status_bytes("VmHWM" if self._peak_reset else "VmRSS")
+            if end is not None:
+                self.stats["memory_bytes"] = max(end - self._rss_start, 0)
+                self.stats["memory_method"] = "peak_rss" if self._peak_reset else "rss_delta"
+        return False
+
+    def record_result(self, result, figure_count=0):
+        """记录结果表格或图表的大小"""
+        self.stats["figure_count"] = figure_count
+        if not result:
+            return
+        if result["type"] == "dataframe":
+            data = result["data"]
+            self.stats["output_rows"] = int(data.shape[0])
+            self.stats["output_columns"] = int(data.shape[1])
+            self.stats["output_bytes"] = int(data.memory_usage(index=True, deep=True).sum())
+        elif result["type"] == "figure":
+            self.stats["figure_bytes"] = sum(
+                os.path.getsize(result[name]) for name in ("path", "thumbnail")
+                if result.get(name) and os.path.exists(result[name])
+            )
+
+
+def format_bytes(size):
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.2f} GB"
+
+
+# 将资源统计整理成一行说明文字
+def describe_stats(stats):
+    parts = []
+    if "wall_seconds" in stats:
+        parts.append(f"耗时 {stats['wall_seconds']:.2f} 秒")
+    if "cpu_seconds" in stats:
+        parts.append(f"CPU {stats['cpu_seconds']:.2f} 秒")
+    if "memory_bytes" in stats:
+        label = "内存峰值增长" if stats.get("memory_method") == "peak_rss" else "内存增长"
+        parts.append(f"{label} {format_bytes(stats['memory_bytes'])}")
+    if "output_rows" in stats:
+        parts.append(f"结果 {stats['output_rows']} 行 × {stats['output_columns']} 列"
+                     f"（{format_bytes(stats['output_bytes'])}）")
+    if stats.get("figure_count"):
+        figure = f"图表 {stats['figure_count']} 张"
+        if stats.get("figure_bytes"):
+            figure += f"（{format_bytes(stats['figure_bytes'])}）"
+        parts.append(figure)
+    return " · ".join(parts)
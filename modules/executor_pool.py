@@ -0,0 +1,297 @@
+import os
+import io
+import time
+import queue
+import atexit
+import threading
+import multiprocessing as mp
+from contextlib import redirect_stdout
+
+# 工作进程数量、单次执行的时间上限（秒）和内存上限（MB），可通过环境变量调整
+EXECUTOR_WORKERS = int(os.environ.get("CHATANALYST_EXECUTOR_WORKERS", str(min(4, os.cpu_count() or 1))))
+EXECUTION_TIMEOUT = float(os.environ.get("CHATANALYST_EXECUTION_TIMEOUT", "120"))
+EXECUTION_MEMORY_MB = int(os.environ.get("CHATANALYST_EXECUTION_MEMORY_MB", "4096"))
+
+# 工作进程中缓存的数据集个数
+WORKER_FRAME_CACHE_SIZE = 2
+
+
+# ---------- 工作进程 ----------
+
+def _set_memory_limit(limit_mb):
+    """在当前地址空间之上再允许 limit_mb 的增长"""
+    try:
+        import resource
+        with open("/proc/self/statm") as f:
+            baseline = int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (ImportError, OSError, ValueError):
+        return
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    soft = baseline + limit_mb * 1024 * 1024
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (soft, hard))
+
+
+def _clear_memory_limit():
+    try:
+        import resource
+    except ImportError:
+        return
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    resource.setrlimit(resource.RLIMIT_AS, (hard, hard))
+
+
+def _load_dataset(dataset, frames):
+    import pandas as pd
+
+    if dataset is None:
+        return None
+    kind = dataset["kind"]
+    if kind == "parquet":
+        # 列式副本以内存映射方式打开，并按文件版本缓存在工作进程中
+        key = (dataset["path"], os.stat(dataset["path"]).st_mtime_ns)
+        if key not in frames:
+            if len(frames) >= WORKER_FRAME_CACHE_SIZE:
+                frames.pop(next(iter(frames)))
+            frames[key] = pd.read_parquet(dataset["path"], memory_map=True)
+        return frames[key]
+    if kind == "arrow_shm":
+        import pyarrow as pa
+        from multiprocessing import shared_memory
+        _release_shared_memory()
+        shm = shared_memory.SharedMemory(name=dataset["name"])
+        reader = pa.ipc.open_stream(pa.py_buffer(shm.buf)[:dataset["size"]])
+        df = reader.read_all().to_pandas()
+        # 数据框可能直接引用共享内存，映射在下一次任务前释放
+        _attached_shm.append(shm)
+        return df
+    return dataset["df"]
+
+
+# 工作进程中仍被数据引用的共享内存块
+_attached_shm = []
+
+
+def _release_shared_memory():
+    import gc
+    gc.collect()
+    for shm in list(_attached_shm):
+        try:
+            shm.close()
+            _attached_shm.remove(shm)
+        except BufferError:
+            pass
+
+
+def _run_job(job, frames):
+    import pandas as pd
+    import numpy as np
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    from modules.figure_store import save_figure
+    from modules.execution_stats import ExecutionMeter
+    from modules.data_cache import private_copy
+
+    output_buffer = io.StringIO()
+    result = None
+    error = None
+    meter = ExecutionMeter(exclusive=True)
+    con = None
+
+    with redirect_stdout(output_buffer):
+        try:
+            df = _load_dataset(job["dataset"], frames)
+            local_vars = {
+                'pd': pd,
+                'np': np,
+                'plt': plt,
+                'sns': sns,
+                # 避免分析代码修改工作进程缓存的数据
+                'df': private_copy(df)
+            }
+            if job.get("tables"):
+                # SQL 引擎在磁盘上流式扫描数据表，只有查询结果读入内存
+                from modules.sql_engine import SQL_MEMORY_MB, open_connection, create_views, make_sql_helper
+                con = open_connection(min(SQL_MEMORY_MB, job["memory_limit_mb"] // 2))
+                create_views(con, job["tables"])
+                local_vars['sql'] = make_sql_helper(con)
+            _set_memory_limit(job["memory_limit_mb"])
+            try:
+                with meter:
+                    exec(job["code"], local_vars)
+                    figure_count = len(plt.get_fignums())
+                    # 检查是否有图表生成
+                    if figure_count:
+                        result = save_figure(plt.gcf())
+                    # 检查是否有返回的DataFrame
+                    elif 'result_df' in local_vars and isinstance(local_vars['result_df'], pd.DataFrame):
+                        result = {"type": "dataframe", "data": local_vars['result_df']}
+                meter.record_result(result, figure_count)
+            finally:
+                _clear_memory_limit()
+        except MemoryError:
+            error = f"代码执行超出内存限制 ({job['memory_limit_mb']} MB)"
+        except Exception as e:
+            error = str(e)
+        finally:
+            plt.close('all')
+            if con is not None:
+                con.close()
+
+    return {
+        "output": output_buffer.getvalue(),
+        "result": result,
+        "error": error,
+        "stats": meter.stats
+    }
+
+
+def _worker_main(conn):
+    # 预先导入分析库，任务到达时无需再加载
+    import matplotlib
+    matplotlib.use("Agg")
+    import pandas  # noqa: F401
+    import numpy  # noqa: F401
+    import matplotlib.pyplot  # noqa: F401
+    import seaborn  # noqa: F401
+
+    frames = {}
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            break
+        if job is None:
+            break
+        conn.send(_run_job(job, frames))
+
+
+# ---------- 主进程 ----------
+
+# 将数据框以Arrow格式写入共享内存，工作进程直接从共享内存读取
+def _dataframe_to_shared_memory(df):
+    import pyarrow as pa
+    from multiprocessing import shared_memory
+
+    table = pa.Table.from_pandas(df, preserve_index=True)
+    sink = pa.MockOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    size = sink.size()
+
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    stream = pa.FixedSizeBufferWriter(pa.py_buffer(shm.buf))
+    with pa.ipc.new_stream(stream, table.schema) as writer:
+        writer.write_table(table)
+    return shm, {"kind": "arrow_shm", "name": shm.name, "size": size}
+
+
+class ExecutorPool:
+    """预热的代码执行进程池，超时或崩溃的工作进程会被终止并替换"""
+
+    def __init__(self, size):
+        self._ctx = mp.get_context("spawn")
+        self._idle = queue.Queue()
+        self._workers = []
+        self._lock = threading.Lock()
+        for _ in range(size):
+            self._idle.put(self._spawn())
+
+    def _spawn(self):
+        parent_conn, child_conn = self._ctx.Pipe()
+        process = self._ctx.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        process.start()
+        child_conn.close()
+        worker = (process, parent_conn)
+        with self._lock:
+            self._workers.append(worker)
+        return worker
+
+    def _replace(self, worker):
+        process, conn = worker
+        process.kill()
+        process.join(timeout=5)
+        conn.close()
+        with self._lock:
+            if worker in self._workers:
+                self._workers.remove(worker)
+        return self._spawn()
+
+    def run(self, job, timeout):
+        worker = self._idle.get()
+        start = time.perf_counter()
+        try:
+            process, conn = worker
+            conn.send(job)
+            if conn.poll(timeout):
+                return conn.recv()
+            worker = self._replace(worker)
+            error = f"代码执行超时（超过 {timeout:.0f} 秒），已终止"
+        except (EOFError, BrokenPipeError, ConnectionResetError, OSError):
+            worker = self._replace(worker)
+            error = "代码执行进程异常退出（可能超出内存限制）"
+        finally:
+            self._idle.put(worker)
+        # 工作进程没有返回统计时，至少记录实际占用的时间
+        return {"output": "", "result": None, "error": error,
+                "stats": {"wall_seconds": round(time.perf_counter() - start, 4)}}
+
+    def shutdown(self):
+        with self._lock:
+            workers = list(self._workers)
+            self._workers.clear()
+        for process, conn in workers:
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+            process.join(timeout=1)
+            if process.is_alive():
+                process.kill()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_executor_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ExecutorPool(EXECUTOR_WORKERS)
+            atexit.register(_pool.shutdown)
+        return _pool
+
+
+# 在工作进程中执行代码
+def run_in_pool(code, user_id, df=None, parquet_path=None, tables=None,
+                timeout=EXECUTION_TIMEOUT, memory_limit_mb=EXECUTION_MEMORY_MB):
+    """优先传递列式副本路径；否则通过共享内存传递Arrow数据，无pyarrow时才序列化数据框
+
+    tables 为 SQL 引擎的数据表（见 sql_engine.get_table_sources），代码中可通过 sql() 查询
+    """
+    shm = None
+    if parquet_path:
+        dataset = {"kind": "parquet", "path": parquet_path}
+    elif df is not None:
+        try:
+            shm, dataset = _dataframe_to_shared_memory(df)
+        except Exception:
+            dataset = {"kind": "pickle", "df": df}
+    else:
+        dataset = None
+
+    job = {
+        "code": code,
+        "user_id": user_id,
+        "dataset": dataset,
+        "tables": tables,
+        "memory_limit_mb": memory_limit_mb
+    }
+    try:
+        return get_executor_pool().run(job, timeout)
+    finally:
+        if shm is not None:
+            shm.close()
+            shm.unlink()
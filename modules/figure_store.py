@@ -0,0 +1,190 @@
+import io
+import os
+import time
+import hashlib
+import sqlite3
+import threading
+
+try:
+    from PIL import Image
+    HAS_PIL = True
+except ImportError:
+    HAS_PIL = False
+
+# 图表按内容哈希存放：figures/<前两位>/<哈希>.png，相同的图表只保存一份
+FIGURE_DIR = "figures"
+INDEX_FILE = "figures/index.db"
+
+# 原图分辨率和缩略图宽度（像素）
+FIGURE_DPI = 100
+THUMBNAIL_WIDTH = 320
+# 调色板压缩的颜色数（需要 Pillow）
+FIGURE_COLORS = 256
+
+# 没有被任何对话引用的图表在保存这么久（秒）之后才会被回收，避免删除刚生成、尚未写入对话的图表
+FIGURE_GC_GRACE = 3600
+# 后台回收的间隔（秒）
+FIGURE_GC_INTERVAL = 6 * 3600
+
+_gc_started = False
+_gc_lock = threading.Lock()
+
+
+def _connect():
+    os.makedirs(FIGURE_DIR, exist_ok=True)
+    conn = sqlite3.connect(INDEX_FILE, timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS figures (
+            id TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            created REAL NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS figure_refs (
+            figure_id TEXT NOT NULL,
+            conversation TEXT NOT NULL,
+            PRIMARY KEY (figure_id, conversation)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_figure_refs_conversation ON figure_refs(conversation)")
+    return conn
+
+
+def get_figure_paths(figure_id):
+    """返回 (原图路径, 缩略图路径)"""
+    base = os.path.join(FIGURE_DIR, figure_id[:2], figure_id)
+    return base + ".png", base + "_thumb.png"
+
+
+def _render_png(fig, dpi):
+    buffer = io.BytesIO()
+    # 去掉元数据，相同的图表得到相同的字节
+    fig.savefig(buffer, format="png", dpi=dpi, metadata={"Software": None})
+    data = buffer.getvalue()
+    if not HAS_PIL:
+        return data
+    # 图表颜色很少，转为调色板图像后体积通常只有原来的几分之一
+    image = Image.open(io.BytesIO(data)).convert("RGB").quantize(colors=FIGURE_COLORS)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue()
+
+
+def _write_file(path, data):
+    if os.path.exists(path):
+        return
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+# 保存图表（原图和缩略图），返回执行结果中的图表信息
+def save_figure(fig):
+    data = _render_png(fig, FIGURE_DPI)
+    figure_id = hashlib.sha256(data).hexdigest()
+    path, thumb_path = get_figure_paths(figure_id)
+
+    # 先登记（刷新时间）再写文件：回收在同一把写锁内删除文件，登记之后文件不会再被删除
+    conn = _connect()
+    try:
+        with conn:
+            conn.execute(
+                "INSERT INTO figures (id, size, created) VALUES (?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET created = excluded.created",
+                (figure_id, len(data), time.time())
+            )
+    finally:
+        conn.close()
+
+    if not os.path.exists(thumb_path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        width_inches = fig.get_size_inches()[0]
+        _write_file(thumb_path, _render_png(fig, min(FIGURE_DPI, THUMBNAIL_WIDTH / width_inches)))
+    _write_file(path, data)
+
+    return {"type": "figure", "figure_id": figure_id, "path": path, "thumbnail": thumb_path}
+
+
+# 提取消息中引用的图表
+def message_figure_ids(messages):
+    ids = set()
+    for message in messages:
+        result = (message.get("execution_result") or {}).get("result")
+        if result and result.get("type") == "figure" and result.get("figure_id"):
+            ids.add(result["figure_id"])
+    return ids
+
+
+# 记录对话对图表的引用（追加消息时）
+def add_figure_references(conversation, figure_ids):
+    if not figure_ids:
+        return
+    conn = _connect()
+    try:
+        with conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO figure_refs (figure_id, conversation) VALUES (?, ?)",
+                [(figure_id, conversation) for figure_id in figure_ids]
+            )
+    except sqlite3.Error:
+        pass
+    finally:
+        conn.close()
+
+
+# 重置对话引用的图表（整个对话被覆盖或清空时）
+def set_figure_references(conversation, figure_ids):
+    conn = _connect()
+    try:
+        with conn:
+            conn.execute("DELETE FROM figure_refs WHERE conversation = ?", (conversation,))
+            conn.executemany(
+                "INSERT OR IGNORE INTO figure_refs (figure_id, conversation) VALUES (?, ?)",
+                [(figure_id, conversation) for figure_id in figure_ids]
+            )
+    except sqlite3.Error:
+        pass
+    finally:
+        conn.close()
+
+
+# 删除没有被任何对话引用的图表，返回删除的个数
+def collect_garbage(grace=FIGURE_GC_GRACE):
+    conn = _connect()
+    try:
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute("""
+                SELECT id FROM figures
+                WHERE created < ? AND NOT EXISTS (SELECT 1 FROM figure_refs WHERE figure_id = figures.id)
+            """, (time.time() - grace,)).fetchall()
+            for (figure_id,) in rows:
+                for path in get_figure_paths(figure_id):
+                    if os.path.exists(path):
+                        os.remove(path)
+                conn.execute("DELETE FROM figures WHERE id = ?", (figure_id,))
+    finally:
+        conn.close()
+    return len(rows)
+
+
+def _gc_loop():
+    while True:
+        try:
+            collect_garbage()
+        except (OSError, sqlite3.Error):
+            pass
+        time.sleep(FIGURE_GC_INTERVAL)
+
+
+# 启动后台图表回收线程（每个进程一次）
+def start_figure_gc():
+    global _gc_started
+    with _gc_lock:
+        if _gc_started:
+            return
+        _gc_started = True
+    threading.Thread(target=_gc_loop, name="figure-gc", daemon=True).start()
@@ -0,0 +1,91 @@
+import os
+import pandas as pd
+from modules.data_cache import HAS_PYARROW, get_columnar_path, read_data_file, write_columnar_sidecar
+
+if HAS_PYARROW:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+# 每个分块的行数
+CSV_CHUNK_ROWS = 200_000
+# 用于推断列类型的样本行数
+DTYPE_INFER_ROWS = 10_000
+
+
+# 根据样本推断分块读取时固定的列类型
+def infer_csv_dtypes(file_path):
+    """整数和布尔列不固定类型（后续分块可能出现缺失值），其余列按样本类型固定"""
+    sample = pd.read_csv(file_path, nrows=DTYPE_INFER_ROWS)
+    dtypes = {}
+    for col, dtype in sample.dtypes.items():
+        if pd.api.types.is_float_dtype(dtype):
+            dtypes[col] = "float64"
+        elif pd.api.types.is_object_dtype(dtype) or pd.api.types.is_string_dtype(dtype):
+            dtypes[col] = str
+    return dtypes
+
+
+# 分块读取CSV，逐块写入Parquet列式副本
+def _stream_csv_to_parquet(file_path, progress_callback=None):
+    total_size = max(os.path.getsize(file_path), 1)
+    sidecar_path = get_columnar_path(file_path)
+    tmp_path = sidecar_path + ".tmp"
+    dtypes = infer_csv_dtypes(file_path)
+    writer = None
+    try:
+        with open(file_path, "rb") as f:
+            for chunk in pd.read_csv(f, chunksize=CSV_CHUNK_ROWS, dtype=dtypes):
+                if writer is None:
+                    schema = pa.Schema.from_pandas(chunk, preserve_index=False)
+                    writer = pq.ParquetWriter(tmp_path, schema)
+                writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+                if progress_callback:
+                    progress_callback(min(f.tell() / total_size, 1.0))
+        if writer is None:
+            return None
+        writer.close()
+        writer = None
+        os.replace(tmp_path, sidecar_path)
+    finally:
+        if writer is not None:
+            writer.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return pd.read_parquet(sidecar_path, memory_map=True)
+
+
+# 分块读取CSV并合并（无pyarrow时使用）
+def _stream_csv_to_frame(file_path, progress_callback=None):
+    total_size = max(os.path.getsize(file_path), 1)
+    dtypes = infer_csv_dtypes(file_path)
+    chunks = []
+    with open(file_path, "rb") as f:
+        for chunk in pd.read_csv(f, chunksize=CSV_CHUNK_ROWS, dtype=dtypes):
+            chunks.append(chunk)
+            if progress_callback:
+                progress_callback(min(f.tell() / total_size, 1.0))
+    if not chunks:
+        return pd.read_csv(file_path)
+    return pd.concat(chunks, ignore_index=True)
+
+
+# 导入已保存到磁盘的数据文件，返回数据框
+def ingest_data_file(file_path, progress_callback=None):
+    """CSV按块解析并直接写入列式副本，峰值内存接近一份数据；Excel整体解析"""
+    if file_path.endswith('.csv'):
+        if HAS_PYARROW:
+            try:
+                df = _stream_csv_to_parquet(file_path, progress_callback)
+                if df is not None:
+                    return df
+            except Exception:
+                # 后续分块与推断的类型不一致时，退回整体解析
+                pass
+        else:
+            return _stream_csv_to_frame(file_path, progress_callback)
+
+    df = read_data_file(file_path)
+    write_columnar_sidecar(file_path, df)
+    if progress_callback:
+        progress_callback(1.0)
+    return df
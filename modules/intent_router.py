@@ -0,0 +1,241 @@
+import re
+
+# 本地模板的置信度阈值，低于该值时交给模型生成代码
+INTENT_CONFIDENCE_THRESHOLD = 0.6
+
+# 出现这些词说明需求较复杂，降低本地模板的置信度
+COMPLEX_MARKERS = [
+    "分组", "每个", "每种", "按照", "趋势", "预测", "回归", "聚类", "对比", "比较",
+    "筛选", "过滤", "排名", "前十", "为什么", "如何", "并且", "然后", "同时"
+]
+
+# 出现这些词说明问题带有筛选、计数或附加条件，本地模板无法回答
+CONDITION_MARKERS = [
+    "大于", "小于", "等于", "超过", "低于", "高于", "之间", "以上", "以下",
+    "数量", "个数", "多少", "哪个", "哪些", "哪里", "最", "填充", "异常", "去掉", "剔除"
+]
+CONDITION_PENALTY = 0.4
+
+# 出现这些词说明问题带有分组、筛选、修改数据或变换等步骤，不使用本地模板
+DISQUALIFYING_MARKERS = ["按", "各", "每", "删除", "填充", "变换", "log", "年", "月", "之后", "后"]
+
+# 单个词（如“统计”“分布”）的权重低于阈值，只有问题其余部分很短时才加上这一分数
+SHORT_QUESTION_BONUS = 0.3
+SHORT_QUESTION_CHARS = 3
+# 命中明确短语（如“描述统计”）时，问题其余部分超过这一长度说明还有其他要求
+RESIDUAL_MAX_CHARS = 6
+RESIDUAL_PENALTY = 0.4
+# 判断问题长短时忽略的常见用语
+FILLER_WORDS = [
+    "请", "帮我", "帮忙", "一下", "看看", "看下", "查看", "计算", "显示", "展示", "画出", "画", "绘制",
+    "生成", "给出", "做", "分析", "数据", "所有", "各列", "每列", "列", "图", "的"
+]
+
+# 已注册的意图
+_intents = []
+
+
+# 注册意图模板
+def register_intent(name, label, keywords):
+    """keywords 为 {关键词: 权重}；被装饰的函数接收 (概况, 提到的列) 并返回代码"""
+    def decorator(build_code):
+        _intents.append({
+            "name": name,
+            "label": label,
+            "keywords": keywords,
+            "build_code": build_code
+        })
+        return build_code
+    return decorator
+
+
+# 找出问题中提到的列名（较长的列名优先，避免被较短的列名截断）
+def find_mentioned_columns(user_input, profile):
+    if not profile:
+        return []
+    text = user_input
+    mentioned = []
+    for name in sorted((col["name"] for col in profile["columns"]), key=len, reverse=True):
+        if not name:
+            continue
+        # 英文列名需完整匹配，避免 "a" 之类的短列名误命中
+        pattern = r"(?<![A-Za-z0-9_])" + re.escape(name) + r"(?![A-Za-z0-9_])"
+        if re.search(pattern, text):
+            mentioned.append(name)
+            text = re.sub(pattern, " ", text)
+    # 按数据中的列顺序返回
+    order = {col["name"]: i for i, col in enumerate(profile["columns"])}
+    return sorted(mentioned, key=order.get)
+
+
+def _numeric_columns(profile, columns=None):
+    if not profile:
+        return []
+    numeric = profile["numeric"]
+    if columns:
+        return [col for col in columns if col in numeric]
+    return list(numeric)
+
+
+def _strip_filler(text):
+    for word in FILLER_WORDS:
+        text = text.replace(word, "")
+    return text
+
+
+# 去掉命中的关键词和常见用语后，问题剩余部分的长度
+def _residual_length(user_input, keywords):
+    text = user_input
+    for keyword in sorted(keywords, key=len, reverse=True):
+        text = text.replace(keyword, "")
+    return len(re.sub(r"[\s\W_]+", "", _strip_filler(text)))
+
+
+# 计算意图的置信度（user_input 中已去掉列名）
+def _score_intent(intent, user_input, threshold=INTENT_CONFIDENCE_THRESHOLD):
+    matches = [(weight, keyword) for keyword, weight in intent["keywords"].items() if keyword in user_input]
+    if not matches:
+        return 0.0
+    # “各列”“每列”等常见用语不算分组
+    text = _strip_filler(user_input)
+    if any(marker in text for marker in DISQUALIFYING_MARKERS):
+        return 0.0
+    score, _ = max(matches)
+    residual = _residual_length(user_input, [keyword for _, keyword in matches])
+    if score < threshold:
+        # 只命中单个词时，问题其余部分很短才认为是常规分析
+        if residual <= SHORT_QUESTION_CHARS:
+            score += SHORT_QUESTION_BONUS
+    elif residual > RESIDUAL_MAX_CHARS:
+        # 明确短语之外还有较多其他内容，交给模型处理
+        score -= RESIDUAL_PENALTY
+    score -= 0.15 * sum(1 for marker in COMPLEX_MARKERS if marker in user_input)
+    score -= CONDITION_PENALTY * sum(1 for marker in CONDITION_MARKERS if marker in user_input)
+    return max(score, 0.0)
+
+
+# 匹配本地意图模板
+def route_intent(user_input, profile=None, threshold=INTENT_CONFIDENCE_THRESHOLD):
+    """返回 {"intent", "label", "confidence", "columns", "code"}；没有足够把握时返回 None"""
+    # 列名中的关键词不参与意图匹配
+    columns = find_mentioned_columns(user_input, profile)
+    text = user_input
+    for name in sorted(columns, key=len, reverse=True):
+        text = re.sub(r"(?<![A-Za-z0-9_])" + re.escape(name) + r"(?![A-Za-z0-9_])", " ", text)
+
+    best, best_score = None, 0.0
+    for intent in _intents:
+        score = _score_intent(intent, text, threshold)
+        if score > best_score:
+            best, best_score = intent, score
+
+    if best is None or best_score < threshold:
+        return None
+
+    code = best["build_code"](profile, columns)
+    if code is None:
+        return None
+    return {
+        "intent": best["name"],
+        "label": best["label"],
+        "confidence": best_score,
+        "columns": columns,
+        "code": code
+    }
+
+
+# 按列名选择列的代码（概况中的列名均为字符串，数据中的列标签可能是数字，例如年份）
+def _column_selector(columns):
+    return f"df.loc[:, df.columns.astype(str).isin({list(columns)!r})]"
+
+
+# ---------- 内置意图 ----------
+
+@register_intent("describe", "描述统计", {"描述统计": 0.95, "描述": 0.5, "统计": 0.5, "summary": 0.5})
+def _describe_code(profile, columns):
+    selector = _column_selector(columns) if columns else "df"
+    return f"""
+# 生成数据描述统计
+result_df = {selector}.describe()
+print("数据描述统计:")
+print(result_df)
+"""
+
+
+@register_intent("correlation", "相关性分析", {"相关性": 0.95, "相关系数": 0.95, "相关": 0.5, "correlation": 0.9})
+def _correlation_code(profile, columns):
+    numeric_cols = _numeric_columns(profile, columns)
+    if len(numeric_cols) < 2:
+        numeric_cols = _numeric_columns(profile)
+    if profile and len(numeric_cols) < 2:
+        return None
+    # 列太多时热力图不可读，限制列数
+    selector = _column_selector(numeric_cols[:20]) if numeric_cols else "df.select_dtypes(include=['number'])"
+    return f"""
+# 计算相关性矩阵
+result_df = {selector}.corr()
+print("相关性矩阵:")
+print(result_df)
+
+# 绘制热力图
+plt.figure(figsize=(10, 8))
+sns.heatmap(result_df, annot=True, cmap='coolwarm', fmt='.2f')
+plt.title('特征相关性热力图')
+plt.tight_layout()
+"""
+
+
+@register_intent("histogram", "分布直方图", {"直方图": 0.95, "分布": 0.5, "histogram": 0.9})
+def _histogram_code(profile, columns):
+    numeric_cols = _numeric_columns(profile, columns) or _numeric_columns(profile)
+    if profile and not numeric_cols:
+        return None
+    # 限制为前4列以避免图表过多
+    if numeric_cols:
+        selector = f"[col for col in df.columns if str(col) in {numeric_cols[:4]!r}]"
+    else:
+        selector = "df.select_dtypes(include=['number']).columns[:4]"
+    return f"""
+# 选择数值列
+numeric_cols = {selector}
+
+# 绘制直方图
+plt.figure(figsize=(12, 10))
+for i, col in enumerate(numeric_cols, 1):
+    plt.subplot(2, 2, i)
+    sns.histplot(df[col], kde=True)
+    plt.title(f'{{col}} 分布')
+plt.tight_layout()
+"""
+
+
+@register_intent("missing", "缺失值统计", {"缺失值": 0.95, "缺失": 0.5, "空值": 0.5})
+def _missing_code(profile, columns):
+    selector = _column_selector(columns) if columns else "df"
+    return f"""
+# 统计缺失值
+missing = {selector}.isnull().sum()
+result_df = pd.DataFrame({{
+    "缺失值数量": missing,
+    "缺失比例(%)": (missing / max(len(df), 1) * 100).round(2)
+}})
+print("缺失值统计:")
+print(result_df)
+"""
+
+
+@register_intent("overview", "数据概览", {"基本信息": 0.9, "概览": 0.9, "数据信息": 0.85, "数据结构": 0.85})
+def _overview_code(profile, columns):
+    return """
+# 基本数据信息
+print("数据基本信息:")
+print(f"行数: {df.shape[0]}, 列数: {df.shape[1]}")
+print("\\n列名:", df.columns.tolist())
+print("\\n数据类型:")
+print(df.dtypes)
+print("\\n缺失值统计:")
+print(df.isnull().sum())
+
+# 生成简单的数据摘要
+result_df = df.describe().T
+"""
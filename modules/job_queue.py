@@ -0,0 +1,197 @@
+import os
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from modules import metrics
+from modules.code_executor import execute_code_on
+from modules.data_manager import add_message_to_conversation
+from modules.model_service import (
+    generate_analysis_code, invalidate_analysis_code, stream_chat_response, run_in_background
+)
+
+logger = logging.getLogger(__name__)
+
+# 同时处理的分析任务数，可通过环境变量调整
+JOB_WORKERS = int(os.environ.get("CHATANALYST_JOB_WORKERS", "8"))
+# 已结束的任务在内存中保留的时间（秒）
+JOB_RETENTION = 3600
+
+# 任务阶段及其显示名称
+JOB_STAGES = {
+    "queued": "排队中...",
+    "generating": "正在生成分析代码...",
+    "executing": "正在执行分析代码...",
+    "summarizing": "正在整理分析结果..."
+}
+
+_job_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class AnalysisJob:
+    """一轮分析任务；结果直接写入所属对话，与提交它的页面会话无关"""
+
+    def __init__(self, username, conversation_id):
+        self.id = uuid.uuid4().hex
+        self.username = username
+        self.conversation_id = conversation_id
+        self.stage = "queued"
+        # queued / running / done / failed / cancelled
+        self.status = "queued"
+        self.partial_response = ""
+        self.error = None
+        self.created = time.time()
+        self.finished_at = None
+        self.future = None
+        self._cancel_event = threading.Event()
+
+    @property
+    def finished(self):
+        return self.status in ("done", "failed", "cancelled")
+
+    @property
+    def cancel_requested(self):
+        return self._cancel_event.is_set()
+
+    def set_stage(self, stage):
+        self.check_cancelled()
+        self.stage = stage
+
+    def check_cancelled(self):
+        if self._cancel_event.is_set():
+            raise JobCancelled()
+
+    def _finish(self, status, error=None):
+        self.status = status
+        self.error = error
+        self.finished_at = time.time()
+
+
+def _purge_finished_jobs():
+    now = time.time()
+    with _jobs_lock:
+        for job_id in [job_id for job_id, job in _jobs.items()
+                       if job.finished and now - job.finished_at > JOB_RETENTION]:
+            del _jobs[job_id]
+
+
+def _run_job(job, pipeline, args):
+    metrics.record_stage("job_queue", time.time() - job.created)
+    job.status = "running"
+    try:
+        pipeline(job, *args)
+        job._finish("done")
+    except JobCancelled:
+        add_message_to_conversation(job.username, job.conversation_id, "system", "已取消本次分析。")
+        job._finish("cancelled")
+    except Exception as e:
+        logger.exception("分析任务失败: %s", job.id)
+        add_message_to_conversation(job.username, job.conversation_id, "assistant", f"分析过程中出错: {e}")
+        job._finish("failed", str(e))
+    metrics.finish_turn(status=job.status)
+
+
+def submit_job(username, conversation_id, pipeline, *args):
+    """pipeline(job, *args) 在后台线程中运行，通过 job.set_stage 报告进度"""
+    _purge_finished_jobs()
+    job = AnalysisJob(username, conversation_id)
+    with _jobs_lock:
+        _jobs[job.id] = job
+    job.future = _job_executor.submit(metrics.bind(_run_job), job, pipeline, args)
+    return job
+
+
+def get_job(job_id):
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+
+# 查找对话中尚未结束的任务（页面刷新后据此恢复进度显示）
+def find_active_job(username, conversation_id):
+    with _jobs_lock:
+        jobs = [job for job in _jobs.values()
+                if job.username == username and job.conversation_id == conversation_id and not job.finished]
+    return min(jobs, key=lambda job: job.created) if jobs else None
+
+
+def cancel_job(job_id):
+    """排队中的任务立即取消；运行中的任务在当前步骤结束后停止"""
+    job = get_job(job_id)
+    if job is None or job.finished:
+        return
+    job._cancel_event.set()
+    if job.future is not None and job.future.cancel():
+        add_message_to_conversation(job.username, job.conversation_id, "system", "已取消本次分析。")
+        job._finish("cancelled")
+
+
+# ---------- 分析任务 ----------
+
+def _collect_response(job, stream):
+    for delta in stream:
+        job.check_cancelled()
+        job.partial_response += delta
+    return job.partial_response
+
+
+def _template_pipeline(job, code, label, user_id, df, file_path):
+    job.set_stage("executing")
+    execution_result = execute_code_on(code, user_id, df, file_path)
+    job.set_stage("summarizing")
+    add_message_to_conversation(
+        job.username, job.conversation_id, "assistant",
+        f"已使用本地模板完成「{label}」分析，结果如下。", code, execution_result
+    )
+
+
+def _model_pipeline(job, user_input, memory_context, df_info, config, user_id, df, file_path,
+                    dataset_fingerprint, question_context, engine="pandas", tables=None):
+    # 助手回复与代码生成、执行并行进行
+    job.set_stage("generating")
+    response_future = run_in_background(
+        _collect_response, job,
+        stream_chat_response(memory_context, df_info, config, dataset_fingerprint, question_context, engine)
+    )
+    code = generate_analysis_code(user_input, df_info, config, dataset_fingerprint, question_context, engine)
+
+    job.set_stage("executing")
+    execution_result = execute_code_on(code, user_id, df, file_path, tables)
+    if execution_result["error"]:
+        invalidate_analysis_code(user_input, df_info, config, dataset_fingerprint, question_context, engine)
+
+    job.set_stage("summarizing")
+    assistant_response = response_future.result()
+    job.check_cancelled()
+    add_message_to_conversation(
+        job.username, job.conversation_id, "assistant", assistant_response, code, execution_result
+    )
+
+
+# 提交使用本地模板的分析任务
+def submit_template_analysis(username, conversation_id, code, label, df, file_path):
+    return submit_job(username, conversation_id, _template_pipeline, code, label, conversation_id, df, file_path)
+
+
+# 提交由模型生成代码的分析任务
+def submit_model_analysis(username, conversation_id, user_input, memory_context, df_info, config, df, file_path,
+                          dataset_fingerprint, question_context):
+    return submit_job(
+        username, conversation_id, _model_pipeline, user_input, memory_context, df_info, config,
+        conversation_id, df, file_path, dataset_fingerprint, question_context
+    )
+
+
+# 提交使用SQL引擎的分析任务（数据表在磁盘上扫描，不需要加载数据框）
+def submit_sql_analysis(username, conversation_id, user_input, memory_context, tables_info, config, tables,
+                        dataset_fingerprint):
+    return submit_job(
+        username, conversation_id, _model_pipeline, user_input, memory_context, tables_info, config,
+        conversation_id, None, None, dataset_fingerprint, None, "sql", tables
+    )
@@ -0,0 +1,224 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from modules.metrics import register_collector
+
+# 模型回复缓存（磁盘），重复的问题无需再次调用模型
+CACHE_FILE = "cache/llm_cache.db"
+
+# 缓存容量上限（MB）和有效期（秒），可通过环境变量调整
+LLM_CACHE_MAX_MB = int(os.environ.get("CHATANALYST_LLM_CACHE_MB", "256"))
+LLM_CACHE_TTL = int(os.environ.get("CHATANALYST_LLM_CACHE_TTL", str(7 * 24 * 3600)))
+# 淘汰时清理到容量的这一比例以下，避免缓存写满后每次写入都触发淘汰
+LLM_CACHE_LOW_WATER = 0.9
+EVICT_BATCH = 100
+
+# 命中率统计
+_stats = {"hits": 0, "misses": 0, "bypassed": 0, "evictions": 0}
+_stats_lock = threading.Lock()
+_schema_ready = False
+
+
+def _count(name, n=1):
+    with _stats_lock:
+        _stats[name] += n
+
+
+def _connect():
+    global _schema_ready
+    os.makedirs(os.path.dirname(CACHE_FILE), exist_ok=True)
+    conn = sqlite3.connect(CACHE_FILE, timeout=10)
+    if not _schema_ready:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+            # 缓存总大小由触发器维护，写入时无需扫描整张表
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            conn.execute(
+                "INSERT OR IGNORE INTO meta (key, value) "
+                "SELECT 'total_size', COALESCE(SUM(size), 0) FROM responses"
+            )
+            conn.execute("""
+                CREATE TRIGGER IF NOT EXISTS responses_size_insert AFTER INSERT ON responses BEGIN
+                    UPDATE meta SET value = value + NEW.size WHERE key = 'total_size';
+                END
+            """)
+            conn.execute("""
+                CREATE TRIGGER IF NOT EXISTS responses_size_delete AFTER DELETE ON responses BEGIN
+                    UPDATE meta SET value = value - OLD.size WHERE key = 'total_size';
+                END
+            """)
+            conn.execute("""
+                CREATE TRIGGER IF NOT EXISTS responses_size_update AFTER UPDATE OF size ON responses BEGIN
+                    UPDATE meta SET value = value - OLD.size + NEW.size WHERE key = 'total_size';
+                END
+            """)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            conn.close()
+            raise
+        _schema_ready = True
+    return conn
+
+
+def _total_size(conn):
+    return conn.execute("SELECT value FROM meta WHERE key = 'total_size'").fetchone()[0]
+
+
+# 是否对该配置启用缓存
+def cache_enabled(config):
+    """非零温度的采样结果默认不缓存，除非配置 cache_nonzero_temperature（可在侧边栏模型设置中开启）"""
+    if not config.get("response_cache", True):
+        return False
+    if config.get("temperature") and not config.get("cache_nonzero_temperature", False):
+        return False
+    return True
+
+
+# 生成缓存键
+def make_cache_key(config, messages, dataset_fingerprint=None):
+    payload = json.dumps(
+        [
+            config.get("model_name"),
+            config.get("temperature"),
+            config.get("max_tokens"),
+            config.get("system_prompt"),
+            messages,
+            dataset_fingerprint
+        ],
+        ensure_ascii=False,
+        sort_keys=True
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# 读取缓存，未命中或已过期时返回 None
+def get_cached_response(key):
+    now = time.time()
+    try:
+        conn = _connect()
+    except sqlite3.Error:
+        return None
+    try:
+        with conn:
+            row = conn.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > LLM_CACHE_TTL:
+                if row is not None:
+                    conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                _count("misses")
+                return None
+            conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+    except sqlite3.Error:
+        # 缓存不可用时按未命中处理，不影响模型调用
+        return None
+    finally:
+        conn.close()
+    _count("hits")
+    return row[0]
+
+
+# 删除一条缓存（例如生成的代码执行失败时）
+def delete_cached_response(key):
+    try:
+        conn = _connect()
+    except sqlite3.Error:
+        return
+    try:
+        with conn:
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+    except sqlite3.Error:
+        pass
+    finally:
+        conn.close()
+
+
+# 超出容量时先删除过期条目，再按最久未访问淘汰到容量的 LLM_CACHE_LOW_WATER 以下，返回淘汰条数
+def _evict(conn, now, max_bytes):
+    conn.execute("DELETE FROM responses WHERE created < ?", (now - LLM_CACHE_TTL,))
+    target = max_bytes * LLM_CACHE_LOW_WATER
+    evicted = 0
+    while _total_size(conn) > target:
+        keys = conn.execute(
+            "SELECT key FROM responses ORDER BY last_access LIMIT ?", (EVICT_BATCH,)
+        ).fetchall()
+        if not keys:
+            break
+        for (old_key,) in keys:
+            conn.execute("DELETE FROM responses WHERE key = ?", (old_key,))
+            evicted += 1
+            if _total_size(conn) <= target:
+                break
+    return evicted
+
+
+# 写入缓存，超出容量时淘汰过期和最久未访问的条目
+def put_cached_response(key, response):
+    now = time.time()
+    size = len(response.encode("utf-8"))
+    max_bytes = LLM_CACHE_MAX_MB * 1024 * 1024
+    try:
+        conn = _connect()
+    except sqlite3.Error:
+        return
+    try:
+        with conn:
+            conn.execute(
+                "INSERT INTO responses (key, response, size, created, last_access) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET response = excluded.response, size = excluded.size, "
+                "created = excluded.created, last_access = excluded.last_access",
+                (key, response, size, now, now)
+            )
+            if _total_size(conn) > max_bytes:
+                _count("evictions", _evict(conn, now, max_bytes))
+    except sqlite3.Error:
+        pass
+    finally:
+        conn.close()
+
+
+# 记录一次未使用缓存的调用
+def record_bypass():
+    _count("bypassed")
+
+
+def cache_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+    return stats
+
+
+def _collect_metrics():
+    stats = cache_stats()
+    return [
+        # 查询次数由 model_service 按调用类型统计（llm_cache_requests_total）
+        ("llm_cache_evictions_total", "counter", {}, stats["evictions"])
+    ]
+
+
+register_collector(_collect_metrics)
+
+
+# 清空缓存
+def clear_cache():
+    conn = _connect()
+    try:
+        with conn:
+            conn.execute("DELETE FROM responses")
+    finally:
+        conn.close()
@@ -0,0 +1,281 @@
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager, nullcontext
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# 是否启用指标采集，以及指标接口的监听地址，可通过环境变量调整
+METRICS_ENABLED = os.environ.get("CHATANALYST_METRICS", "0").lower() in ("1", "true", "yes")
+METRICS_HOST = os.environ.get("CHATANALYST_METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.environ.get("CHATANALYST_METRICS_PORT", "9108"))
+
+METRIC_PREFIX = "chatanalyst_"
+# 耗时直方图的分桶（秒）
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+# 内存、数据大小直方图的分桶（字节，64KB 到 16GB）
+SIZE_BUCKETS = tuple(64 * 1024 * 4 ** i for i in range(10))
+
+# 每轮对话一行结构化日志
+turn_logger = logging.getLogger("chatanalyst.turn")
+
+_lock = threading.Lock()
+# (指标名, 排序后的标签) -> 值 / [各分桶计数, 总和, 次数, 分桶]
+_counters = {}
+_histograms = {}
+_help = {}
+_collectors = []
+_server = None
+
+# 当前这一轮对话的记录；后台线程通过 bind 继承
+_current_turn = contextvars.ContextVar("chatanalyst_turn", default=None)
+
+_NOOP = nullcontext()
+
+
+def enabled():
+    return METRICS_ENABLED
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+# 计数器加一（或加 value）
+def inc(name, value=1, help=None, **labels):
+    if not METRICS_ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+        if help:
+            _help.setdefault(name, help)
+
+
+# 记录一次耗时等观测值（同一指标应始终使用相同的分桶）
+def observe(name, value, help=None, buckets=DURATION_BUCKETS, **labels):
+    if not METRICS_ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        entry = _histograms.get(key)
+        if entry is None:
+            entry = _histograms[key] = [[0] * len(buckets), 0.0, 0, buckets]
+            if help:
+                _help.setdefault(name, help)
+        for i, bound in enumerate(entry[3]):
+            if value <= bound:
+                entry[0][i] += 1
+        entry[1] += value
+        entry[2] += 1
+
+
+# 记录一个处理阶段的耗时（用于无法用 with 包住的阶段，例如排队等待）
+def record_stage(name, seconds, **labels):
+    if not METRICS_ENABLED:
+        return
+    observe("stage_seconds", seconds, help="各处理阶段的耗时", stage=name, **labels)
+    turn = _current_turn.get()
+    if turn is not None:
+        turn.add_stage(name, seconds)
+
+
+@contextmanager
+def _timed_stage(name, labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start, **labels)
+
+
+# 统计一个处理阶段的耗时（未启用时为空操作）
+def stage(name, **labels):
+    if not METRICS_ENABLED:
+        return _NOOP
+    return _timed_stage(name, labels)
+
+
+class Turn:
+    """一轮对话的各阶段耗时和模型调用情况"""
+
+    def __init__(self, fields):
+        self.id = uuid.uuid4().hex[:12]
+        self.fields = dict(fields)
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.counts = {}
+        self._lock = threading.Lock()
+
+    def add_stage(self, name, seconds):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def add(self, name, value=1):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + value
+
+    def annotate(self, **fields):
+        with self._lock:
+            self.fields.update(fields)
+
+    def record(self):
+        with self._lock:
+            return {
+                "event": "turn",
+                "turn_id": self.id,
+                **self.fields,
+                "total_seconds": round(time.perf_counter() - self.started, 4),
+                "stages": {name: round(seconds, 4) for name, seconds in self.stages.items()},
+                **self.counts
+            }
+
+
+# 开始记录一轮对话
+def start_turn(**fields):
+    if not METRICS_ENABLED:
+        return None
+    turn = Turn(fields)
+    _current_turn.set(turn)
+    return turn
+
+
+# 结束当前这一轮对话，输出结构化日志
+def finish_turn(**fields):
+    turn = _current_turn.get()
+    if turn is None:
+        return
+    _current_turn.set(None)
+    turn.annotate(**fields)
+    record = turn.record()
+    observe("turn_seconds", record["total_seconds"], help="每轮对话的总耗时", kind=record.get("kind", ""))
+    turn_logger.info(json.dumps(record, ensure_ascii=False))
+
+
+# 当前线程不再记录这一轮对话（由后台任务负责结束时调用）
+def detach_turn():
+    _current_turn.set(None)
+
+
+# 为当前这一轮对话补充字段或计数
+def annotate(**fields):
+    turn = _current_turn.get()
+    if turn is not None:
+        turn.annotate(**fields)
+
+
+def add_to_turn(name, value=1):
+    turn = _current_turn.get()
+    if turn is not None:
+        turn.add(name, value)
+
+
+# 让在线程池中运行的函数继承当前这一轮对话
+def bind(fn):
+    if not METRICS_ENABLED or _current_turn.get() is None:
+        return fn
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+
+# 注册在导出时才读取的指标，返回 [(指标名, 类型, 标签, 值)]
+def register_collector(collector):
+    with _lock:
+        _collectors.append(collector)
+
+
+# ---------- Prometheus 文本格式 ----------
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    parts = []
+    for name, value in labels:
+        escaped = str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        parts.append(f'{name}="{escaped}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def render_prometheus():
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: [list(entry[0]), entry[1], entry[2], entry[3]] for key, entry in _histograms.items()}
+        help_texts = dict(_help)
+        collectors = list(_collectors)
+
+    samples = {}
+    for (name, labels), value in counters.items():
+        samples.setdefault((name, "counter"), []).append((labels, value))
+    for collector in collectors:
+        try:
+            for name, metric_type, labels, value in collector():
+                samples.setdefault((name, metric_type), []).append((tuple(sorted(labels.items())), value))
+        except Exception:
+            continue
+
+    lines = []
+    for (name, metric_type), values in sorted(samples.items()):
+        full_name = METRIC_PREFIX + name
+        if name in help_texts:
+            lines.append(f"# HELP {full_name} {help_texts[name]}")
+        lines.append(f"# TYPE {full_name} {metric_type}")
+        for labels, value in values:
+            lines.append(f"{full_name}{_format_labels(labels)} {value}")
+
+    for name in sorted({name for name, _ in histograms}):
+        full_name = METRIC_PREFIX + name
+        if name in help_texts:
+            lines.append(f"# HELP {full_name} {help_texts[name]}")
+        lines.append(f"# TYPE {full_name} histogram")
+        for (metric, labels), (buckets, total, count, bounds) in sorted(histograms.items()):
+            if metric != name:
+                continue
+            for bound, bucket_count in zip(bounds, buckets):
+                lines.append(f"{full_name}_bucket{_format_labels(labels + (('le', bound),))} {bucket_count}")
+            lines.append(f"{full_name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{full_name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{full_name}_count{_format_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+# 启动指标接口（每个进程一次；未启用或端口被占用时不启动）
+def start_metrics_server(host=METRICS_HOST, port=METRICS_PORT):
+    global _server
+    if not METRICS_ENABLED:
+        return None
+    with _lock:
+        if _server is not None:
+            return _server
+        try:
+            _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        except OSError:
+            logging.getLogger(__name__).warning("指标接口端口 %s 不可用", port)
+            return None
+        _server.daemon_threads = True
+    threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+
+    # 没有配置日志输出时，每轮对话的日志直接输出到标准错误
+    if not turn_logger.handlers and not logging.getLogger().handlers:
+        turn_logger.addHandler(logging.StreamHandler())
+        turn_logger.setLevel(logging.INFO)
+    return _server
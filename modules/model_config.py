@@ -1,4 +1,6 @@
 import os
+import time
+import threading
 import streamlit as st
 import json
 
@@ -10,47 +12,88 @@ DEFAULT_CONFIG = {
     "model_name": "gpt-3.5-turbo",
     "temperature": 0.7,
     "max_tokens": 2000,
+    "timeout": 120,
+    "connect_timeout": 10,
+    "max_connections": 32,
+    "response_cache": True,
+    "cache_nonzero_temperature": False,
+    "schema_token_budget": 3000,
     "system_prompt": "你是一个专业的数据分析助手，擅长解读数据并生成Python代码进行数据分析。请根据用户的需求，生成相应的分析代码。"
 }
 
 # 配置文件路径
 CONFIG_FILE = "config/model_config.json"
 
+# 两次检查配置文件修改时间的最小间隔（秒）
+CONFIG_CHECK_INTERVAL = 1.0
+
+# 进程级配置缓存：文件只在修改时间变化后重新读取
+_config_cache = {"config": None, "mtime": None, "checked": 0.0}
+_config_lock = threading.Lock()
+
 # 确保配置目录存在
 def ensure_config_dir():
     os.makedirs("config", exist_ok=True)
 
-# 加载模型配置
+# 加载模型配置（返回的字典为共享缓存，调用方不应修改）
 def load_model_config():
-    ensure_config_dir()
-    
-    if os.path.exists(CONFIG_FILE):
+    now = time.monotonic()
+    with _config_lock:
+        if _config_cache["config"] is not None and now - _config_cache["checked"] < CONFIG_CHECK_INTERVAL:
+            return _config_cache["config"]
+        
         try:
-            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except:
-            return DEFAULT_CONFIG
-    else:
-        # 如果配置文件不存在，创建默认配置
-        save_model_config(DEFAULT_CONFIG)
-        return DEFAULT_CONFIG
+            mtime = os.stat(CONFIG_FILE).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        
+        if _config_cache["config"] is None or mtime != _config_cache["mtime"]:
+            if mtime is None:
+                # 如果配置文件不存在，创建默认配置
+                _write_config_file(DEFAULT_CONFIG)
+                config = DEFAULT_CONFIG
+                mtime = os.stat(CONFIG_FILE).st_mtime_ns
+            else:
+                try:
+                    with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
+                        config = json.load(f)
+                except (OSError, ValueError):
+                    config = DEFAULT_CONFIG
+            _config_cache["config"] = config
+            _config_cache["mtime"] = mtime
+        
+        _config_cache["checked"] = now
+        return _config_cache["config"]
 
-# 保存模型配置
-def save_model_config(config):
+def _write_config_file(config):
     ensure_config_dir()
-    
-    with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
+    tmp_path = CONFIG_FILE + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
         json.dump(config, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, CONFIG_FILE)
+
+# 保存模型配置
+def save_model_config(config):
+    with _config_lock:
+        _write_config_file(config)
+        _config_cache["config"] = config
+        _config_cache["mtime"] = os.stat(CONFIG_FILE).st_mtime_ns
+        _config_cache["checked"] = time.monotonic()
+
+# 获取当前会话生效的模型配置：文件配置之上叠加会话级覆盖项
+def get_model_config():
+    config = load_model_config()
+    overrides = st.session_state.get("model_config_overrides")
+    if overrides:
+        return {**config, **overrides}
+    return config
 
 # 显示模型配置界面
 def show_model_config():
     st.sidebar.subheader("模型配置")
     
     # 加载当前配置
-    if 'model_config' not in st.session_state:
-        st.session_state.model_config = load_model_config()
-    
-    config = st.session_state.model_config
+    config = get_model_config()
     
     # 创建配置表单
     with st.sidebar.expander("模型设置", expanded=False):
@@ -83,22 +126,36 @@ def show_model_config():
         temperature = st.slider("温度", min_value=0.0, max_value=1.0, value=config.get("temperature", 0.7), step=0.1)
         max_tokens = st.number_input("最大生成长度", min_value=100, max_value=8000, value=config.get("max_tokens", 2000), step=100)
         system_prompt = st.text_area("系统提示词", value=config.get("system_prompt", DEFAULT_CONFIG["system_prompt"]), height=100)
+        response_cache = st.checkbox("缓存模型回复", value=config.get("response_cache", True))
+        cache_nonzero_temperature = st.checkbox(
+            "温度非零时也缓存", value=config.get("cache_nonzero_temperature", False),
+            disabled=not response_cache,
+            help="默认只缓存温度为0的回复；温度非零（如默认的0.7）时开启后才会缓存，相同问题将复用之前生成的代码和回复"
+        )
         
         # 保存按钮
         if st.button("保存配置"):
+            # 保留界面上未展示的配置项（如超时和连接数）
             new_config = {
+                **config,
                 "provider": provider,
                 "base_url": base_url,
                 "api_key": api_key,
                 "model_name": model_name,
                 "temperature": temperature,
                 "max_tokens": max_tokens,
-                "system_prompt": system_prompt
+                "system_prompt": system_prompt,
+                "response_cache": response_cache,
+                "cache_nonzero_temperature": cache_nonzero_temperature
             }
             
-            # 更新会话状态和保存到文件
-            st.session_state.model_config = new_config
+            # 保存到文件，已保存的设置不再需要会话级覆盖
             save_model_config(new_config)
+            st.session_state.pop("model_config_overrides", None)
+            
+            # 丢弃按旧配置创建的客户端连接
+            from modules.model_service import clear_model_clients
+            clear_model_clients()
             st.success("配置已保存!")
     
-    return st.session_state.model_config 
\ No newline at end of file
+    return get_model_config()
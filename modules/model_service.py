@@ -1,144 +1,280 @@
 import openai
-import json
-import streamlit as st
-from modules.model_config import load_model_config
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from modules.model_config import get_model_config
+from modules.prompt_builder import build_code_messages, build_chat_messages
+from modules.data_profile import get_dataset_profile, render_profile, render_question_columns, schema_fingerprint
+from modules.llm_cache import (
+    cache_enabled, make_cache_key, get_cached_response, put_cached_response, delete_cached_response, record_bypass
+)
+from modules.utils import estimate_tokens
+from modules import metrics
 
-# 初始化模型客户端
-def get_model_client():
+# 并发调用模型的线程池（各会话共享）
+LLM_THREADS = int(os.environ.get("CHATANALYST_LLM_THREADS", "16"))
+_llm_executor = ThreadPoolExecutor(max_workers=LLM_THREADS, thread_name_prefix="llm")
+
+# 客户端连接设置的默认值（可在模型配置中覆盖）
+DEFAULT_REQUEST_TIMEOUT = 120.0
+DEFAULT_CONNECT_TIMEOUT = 10.0
+DEFAULT_MAX_CONNECTIONS = 32
+DEFAULT_MAX_RETRIES = 2
+
+# 进程级客户端注册表：相同连接设置的会话共享一个客户端及其连接池
+_clients = {}
+_clients_lock = threading.Lock()
+
+def _client_key(config):
+    return (
+        config.get("base_url"),
+        config.get("api_key"),
+        float(config.get("timeout", DEFAULT_REQUEST_TIMEOUT)),
+        float(config.get("connect_timeout", DEFAULT_CONNECT_TIMEOUT)),
+        int(config.get("max_connections", DEFAULT_MAX_CONNECTIONS)),
+        int(config.get("max_retries", DEFAULT_MAX_RETRIES))
+    )
+
+def _create_client(key):
+    base_url, api_key, timeout, connect_timeout, max_connections, max_retries = key
+    # 使用与 openai 依赖的 httpx 版本一致的 Limits 类型
+    limits = type(openai.DEFAULT_CONNECTION_LIMITS)(
+        max_connections=max_connections,
+        max_keepalive_connections=max_connections
+    )
+    http_client = openai.DefaultHttpxClient(
+        limits=limits,
+        timeout=openai.Timeout(timeout, connect=connect_timeout)
+    )
+    return openai.OpenAI(
+        base_url=base_url,
+        api_key=api_key,
+        max_retries=max_retries,
+        http_client=http_client
+    )
+
+# 初始化模型客户端（复用已有客户端的长连接）
+def get_model_client(config=None):
     # 获取模型配置
-    config = st.session_state.get('model_config', load_model_config())
+    if config is None:
+        config = get_model_config()
     
     # 检查API密钥是否存在
     if not config.get("api_key"):
         return None, "请先在模型配置中设置API密钥"
     
     try:
-        # 创建OpenAI客户端
-        client = openai.OpenAI(
-            base_url=config.get("base_url"),
-            api_key=config.get("api_key")
-        )
+        key = _client_key(config)
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _create_client(key)
+                _clients[key] = client
         return client, None
     except Exception as e:
         return None, f"初始化模型客户端失败: {str(e)}"
 
-# 生成分析代码
-def generate_analysis_code(user_input, dataframe_info):
-    # 获取模型客户端
-    client, error = get_model_client()
-    if error:
-        return f"# 错误: {error}\nprint('无法连接到模型服务')"
+# 移除所有缓存的客户端（模型配置变更后调用）
+# 不主动关闭连接，其他会话正在进行的请求完成后由垃圾回收释放
+def clear_model_clients():
+    with _clients_lock:
+        _clients.clear()
+
+# 从模型回复中提取代码
+def extract_code(text):
+    code = text.strip()
     
-    # 获取模型配置
-    config = st.session_state.get('model_config', load_model_config())
+    # 如果代码被包裹在```python和```之间，提取出来
+    if code.startswith("```python"):
+        code = code.split("```python")[1]
+    if code.startswith("```"):
+        code = code.split("```")[1]
+    if code.endswith("```"):
+        code = code.split("```")[0]
     
-    try:
-        # 准备消息
-        messages = [
-            {"role": "system", "content": config.get("system_prompt")},
-            {"role": "user", "content": f"""
-我需要对以下数据进行分析:
-
-数据信息:
-{dataframe_info}
-
-用户需求:
-{user_input}
-
-请生成Python代码来完成这个分析任务。代码应该使用pandas、numpy、matplotlib和seaborn库。
-代码中应该使用变量名'df'来引用数据框。
-只返回Python代码，不要有其他解释。
-"""}
-        ]
-        
-        # 调用模型API
+    return code.strip()
+
+# 计算回复缓存键，不使用缓存时返回 None
+def _response_cache_key(messages, config, dataset_fingerprint):
+    if not cache_enabled(config):
+        record_bypass()
+        return None
+    return make_cache_key(config, messages, dataset_fingerprint)
+
+# 查询回复缓存，并记录命中情况
+def _lookup_cache(key, kind):
+    if not key:
+        metrics.inc("llm_cache_requests_total", help="模型回复缓存的查询次数", kind=kind, result="bypass")
+        metrics.add_to_turn("llm_cache_bypass")
+        return None
+    cached = get_cached_response(key)
+    result = "hit" if cached is not None else "miss"
+    metrics.inc("llm_cache_requests_total", help="模型回复缓存的查询次数", kind=kind, result=result)
+    metrics.add_to_turn(f"llm_cache_{result}")
+    return cached
+
+
+# 记录模型调用的token数（服务端未返回用量时按文本估算）
+def _record_tokens(kind, messages, completion, usage=None):
+    if not metrics.enabled():
+        return
+    if usage is not None:
+        prompt_tokens, completion_tokens = usage.prompt_tokens, usage.completion_tokens
+    else:
+        prompt_tokens = sum(estimate_tokens(msg["content"]) for msg in messages)
+        completion_tokens = estimate_tokens(completion)
+    metrics.inc("llm_tokens_total", prompt_tokens, help="模型调用的token数", kind=kind, type="prompt")
+    metrics.inc("llm_tokens_total", completion_tokens, kind=kind, type="completion")
+    metrics.add_to_turn("prompt_tokens", prompt_tokens)
+    metrics.add_to_turn("completion_tokens", completion_tokens)
+
+# 调用模型（带回复缓存）
+def _complete(client, messages, config, dataset_fingerprint=None, kind="code"):
+    key = _response_cache_key(messages, config, dataset_fingerprint)
+    cached = _lookup_cache(key, kind)
+    if cached is not None:
+        return cached
+    
+    with metrics.stage("llm", kind=kind):
         response = client.chat.completions.create(
             model=config.get("model_name"),
             messages=messages,
             temperature=config.get("temperature"),
             max_tokens=config.get("max_tokens")
         )
-        
-        # 提取代码
-        code = response.choices[0].message.content.strip()
-        
-        # 如果代码被包裹在```python和```之间，提取出来
-        if code.startswith("```python"):
-            code = code.split("```python")[1]
-        if code.startswith("```"):
-            code = code.split("```")[1]
-        if code.endswith("```"):
-            code = code.split("```")[0]
-            
-        return code.strip()
+    content = response.choices[0].message.content
+    _record_tokens(kind, messages, content or "", getattr(response, "usage", None))
+    if key and content:
+        put_cached_response(key, content)
+    return content
+
+# 调用模型完成一组消息（带回复缓存和指标），出错时返回 None
+def generate_completion(messages, config, kind, temperature=None, max_tokens=None):
+    """temperature / max_tokens 覆盖模型配置中的值，例如后台生成对话摘要"""
+    if temperature is not None or max_tokens is not None:
+        config = {
+            **config,
+            "temperature": config.get("temperature") if temperature is None else temperature,
+            "max_tokens": config.get("max_tokens") if max_tokens is None else max_tokens
+        }
+    client, error = get_model_client(config)
+    if error:
+        return None
+    return _complete(client, messages, config, kind=kind)
+
+# 流式调用模型（带回复缓存），逐段返回生成的文本；命中缓存时一次返回完整文本
+def _stream_completion(client, messages, config, dataset_fingerprint=None, kind="chat"):
+    key = _response_cache_key(messages, config, dataset_fingerprint)
+    cached = _lookup_cache(key, kind)
+    if cached is not None:
+        yield cached
+        return
+    
+    started = time.perf_counter()
+    response = client.chat.completions.create(
+        model=config.get("model_name"),
+        messages=messages,
+        temperature=config.get("temperature"),
+        max_tokens=config.get("max_tokens"),
+        stream=True
+    )
+    parts = []
+    for chunk in response:
+        if chunk.choices and chunk.choices[0].delta.content:
+            if not parts:
+                ttft = time.perf_counter() - started
+                metrics.observe("llm_ttft_seconds", ttft, help="模型流式输出首个token的耗时", kind=kind)
+                metrics.annotate(**{f"{kind}_ttft_seconds": round(ttft, 4)})
+            parts.append(chunk.choices[0].delta.content)
+            yield parts[-1]
+    metrics.record_stage("llm", time.perf_counter() - started, kind=kind)
+    _record_tokens(kind, messages, "".join(parts))
+    
+    # 完整生成后才写入缓存
+    if key and parts:
+        put_cached_response(key, "".join(parts))
+
+# 生成分析代码
+def generate_analysis_code(user_input, dataframe_info, config=None, dataset_fingerprint=None, question_context=None,
+                           engine="pandas"):
+    # 获取模型配置（在线程池中调用时由调用方传入）
+    if config is None:
+        config = get_model_config()
+    
+    # 获取模型客户端
+    client, error = get_model_client(config)
+    if error:
+        return f"# 错误: {error}\nprint('无法连接到模型服务')"
+    
+    try:
+        # 调用模型API并提取代码
+        messages = build_code_messages(user_input, dataframe_info, config, question_context, engine)
+        content = _complete(client, messages, config, dataset_fingerprint, kind="code")
+        return extract_code(content)
         
     except Exception as e:
         return f"# 错误: {str(e)}\nprint('模型调用失败')"
 
-# 生成对话回复
-def generate_chat_response(conversation_history, dataframe_info=None):
-    # 获取模型客户端
-    client, error = get_model_client()
-    if error:
-        return f"错误: {error}。请检查模型配置。"
+# 生成的代码执行失败时删除其缓存，避免同一问题再次得到出错的代码（参数与 generate_analysis_code 相同）
+def invalidate_analysis_code(user_input, dataframe_info, config=None, dataset_fingerprint=None, question_context=None,
+                             engine="pandas"):
+    if config is None:
+        config = get_model_config()
+    if not cache_enabled(config):
+        return
+    messages = build_code_messages(user_input, dataframe_info, config, question_context, engine)
+    delete_cached_response(make_cache_key(config, messages, dataset_fingerprint))
+
+# 流式生成对话回复，可直接交给 st.write_stream
+def stream_chat_response(conversation_history, dataframe_info=None, config=None, dataset_fingerprint=None,
+                         question_context=None, engine="pandas"):
+    if config is None:
+        config = get_model_config()
     
-    # 获取模型配置
-    config = st.session_state.get('model_config', load_model_config())
+    client, error = get_model_client(config)
+    if error:
+        yield f"错误: {error}。请检查模型配置。"
+        return
     
     try:
-        # 准备消息
-        messages = [{"role": "system", "content": config.get("system_prompt")}]
-        
-        # 如果有数据框信息，添加到系统消息
-        if dataframe_info:
-            messages[0]["content"] += f"\n\n当前数据信息:\n{dataframe_info}"
-        
-        # 添加对话历史
-        for msg in conversation_history:
-            if msg["role"] in ["user", "assistant", "system"]:
-                messages.append({"role": msg["role"], "content": msg["content"]})
-        
-        # 调用模型API
-        response = client.chat.completions.create(
-            model=config.get("model_name"),
-            messages=messages,
-            temperature=config.get("temperature"),
-            max_tokens=config.get("max_tokens")
+        yield from _stream_completion(
+            client, build_chat_messages(conversation_history, dataframe_info, config, question_context, engine), config,
+            dataset_fingerprint
         )
-        
-        # 返回回复内容
-        return response.choices[0].message.content
-        
     except Exception as e:
-        return f"错误: {str(e)}。请检查网络连接或API密钥是否正确。"
+        yield f"错误: {str(e)}。请检查网络连接或API密钥是否正确。"
+
+# 在模型调用线程池中执行任务，返回 Future
+def run_in_background(fn, *args, **kwargs):
+    if not metrics.enabled():
+        return _llm_executor.submit(fn, *args, **kwargs)
+    
+    submitted = time.perf_counter()
+    
+    def run():
+        # 线程池排队等待的时间
+        metrics.record_stage("llm_queue", time.perf_counter() - submitted)
+        return fn(*args, **kwargs)
+    return _llm_executor.submit(metrics.bind(run))
 
 # 获取数据框信息
-def get_dataframe_info(df):
+def get_dataframe_info(df, file_path=None, question=None, token_budget=None):
     if df is None:
         return "未加载数据"
     
-    # 基本信息
-    info = f"数据形状: {df.shape[0]} 行, {df.shape[1]} 列\n"
-    
-    # 列名和数据类型
-    info += "列信息:\n"
-    for col in df.columns:
-        dtype = df[col].dtype
-        info += f"- {col} ({dtype})\n"
-    
-    # 数值列的基本统计
-    numeric_cols = df.select_dtypes(include=['number']).columns
-    if len(numeric_cols) > 0:
-        info += "\n数值列统计:\n"
-        stats = df[numeric_cols].describe().T
-        for col in stats.index:
-            info += f"- {col}: 均值={stats.loc[col, 'mean']:.2f}, 最小值={stats.loc[col, 'min']:.2f}, 最大值={stats.loc[col, 'max']:.2f}\n"
-    
-    # 缺失值信息
-    missing = df.isnull().sum()
-    if missing.sum() > 0:
-        info += "\n缺失值信息:\n"
-        for col in missing[missing > 0].index:
-            info += f"- {col}: {missing[col]} 个缺失值 ({missing[col]/len(df)*100:.1f}%)\n"
-    
-    return info 
\ No newline at end of file
+    # 概况按数据文件版本缓存，重复提问时无需重新统计；宽表按token预算摘要
+    with metrics.stage("dataframe_info"):
+        return render_profile(get_dataset_profile(df, file_path), question, token_budget)
+
+# 获取与问题相关的列信息（数据概况为摘要形式时，补充问题中提到的列的详细统计）
+def get_question_context(df, file_path=None, question=None, token_budget=None):
+    if df is None or not question:
+        return None
+    return render_question_columns(get_dataset_profile(df, file_path), question, token_budget)
+
+# 获取数据集结构指纹（用于回复缓存键）
+def get_dataset_fingerprint(df, file_path=None):
+    if df is None:
+        return None
+    return schema_fingerprint(get_dataset_profile(df, file_path))
@@ -0,0 +1,70 @@
+import hashlib
+import logging
+from modules import metrics
+
+logger = logging.getLogger(__name__)
+
+# 代码生成规范（放在共享前缀中，两个模型调用都能复用推理服务的前缀缓存）
+CODE_RULES = """生成分析代码时请遵守:
+- 使用pandas、numpy、matplotlib和seaborn库。
+- 使用变量名'df'来引用数据框。
+- 需要表格结果时赋值给变量'result_df'。"""
+
+# 使用SQL引擎时的代码生成规范（数据不读入内存，没有变量'df'）
+SQL_CODE_RULES = """生成分析代码时请遵守:
+- 数据文件已注册为SQL数据表，使用 sql("SELECT ...") 查询（DuckDB语法），返回pandas数据框。
+- 数据表可能非常大：先在SQL中完成过滤、聚合和表连接，只取回汇总后的结果，不要查询整张表。
+- 使用pandas、numpy、matplotlib和seaborn处理查询结果和绘图，代码中没有变量'df'。
+- 需要表格结果时赋值给变量'result_df'。"""
+
+# 代码生成请求的结尾指令
+CODE_INSTRUCTION = "请生成Python代码来完成这个分析任务。只返回Python代码，不要有其他解释。"
+
+
+# 构建共享前缀：系统提示词、代码规范和数据概况
+def build_prefix_message(config, dataframe_info=None, engine="pandas"):
+    """同一数据集上的代码生成和对话回复使用逐字节相同的系统消息，变化的内容只出现在其后"""
+    parts = [config.get("system_prompt") or "", SQL_CODE_RULES if engine == "sql" else CODE_RULES]
+    if dataframe_info:
+        parts.append(f"当前数据信息:\n{dataframe_info}")
+    return {"role": "system", "content": "\n\n".join(parts)}
+
+
+def prefix_hash(message):
+    return hashlib.sha256(message["content"].encode("utf-8")).hexdigest()[:16]
+
+
+# 记录共享前缀的指纹：写入本轮对话日志（与首字延迟、缓存命中等指标放在一起），便于检查前缀是否稳定
+def _log_prefix(kind, prefix):
+    digest = prefix_hash(prefix)
+    metrics.annotate(**{f"{kind}_prefix_hash": digest, f"{kind}_prefix_chars": len(prefix["content"])})
+    logger.info("prompt kind=%s prefix_hash=%s prefix_chars=%d", kind, digest, len(prefix["content"]))
+
+
+# 构建代码生成的消息
+def build_code_messages(user_input, dataframe_info, config, question_context=None, engine="pandas"):
+    prefix = build_prefix_message(config, dataframe_info, engine)
+    _log_prefix("code", prefix)
+
+    content = f"用户需求:\n{user_input}\n\n"
+    if question_context:
+        content += f"{question_context}\n\n"
+    content += CODE_INSTRUCTION
+    return [prefix, {"role": "user", "content": content}]
+
+
+# 构建对话回复的消息
+def build_chat_messages(conversation_history, dataframe_info, config, question_context=None, engine="pandas"):
+    prefix = build_prefix_message(config, dataframe_info, engine)
+    _log_prefix("chat", prefix)
+
+    messages = [prefix]
+    # 添加对话历史
+    for msg in conversation_history:
+        if msg["role"] in ["user", "assistant", "system"]:
+            messages.append({"role": msg["role"], "content": msg["content"]})
+
+    # 与问题相关的补充信息附在最后一条用户消息之后，不影响共享前缀
+    if question_context and len(messages) > 1 and messages[-1]["role"] == "user":
+        messages[-1] = {"role": "user", "content": f"{messages[-1]['content']}\n\n{question_context}"}
+    return messages
@@ -0,0 +1,222 @@
+import os
+import re
+import hashlib
+import threading
+
+try:
+    import duckdb
+    HAS_DUCKDB = True
+except ImportError:
+    HAS_DUCKDB = False
+
+# 代码执行进程只用到查询部分，应用模块（依赖streamlit）在函数中按需导入
+
+# SQL 引擎可使用的内存（MB，超出部分写入临时目录）、线程数和临时目录，可通过环境变量调整
+SQL_MEMORY_MB = int(os.environ.get("CHATANALYST_SQL_MEMORY_MB", "2048"))
+SQL_THREADS = int(os.environ.get("CHATANALYST_SQL_THREADS", str(min(4, os.cpu_count() or 1))))
+SQL_TEMP_DIR = os.environ.get("CHATANALYST_SQL_TEMP_DIR", "cache/duckdb")
+# 单次查询取回的最大行数，防止把整张大表读入内存
+SQL_RESULT_MAX_ROWS = int(os.environ.get("CHATANALYST_SQL_RESULT_MAX_ROWS", "1000000"))
+
+# 数据表说明缓存：数据表版本 -> 说明文字
+_info_cache = {}
+_preview_cache = {}
+_cache_lock = threading.Lock()
+_CACHE_MAX_ENTRIES = 64
+
+
+def _literal(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _identifier(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+# 由文件名生成数据表名
+def table_name(file_name, used=()):
+    name = re.sub(r"\W+", "_", os.path.splitext(file_name)[0]).strip("_").lower() or "data"
+    if name[0].isdigit():
+        name = "t_" + name
+    candidate, suffix = name, 2
+    while candidate in used:
+        candidate = f"{name}_{suffix}"
+        suffix += 1
+    return candidate
+
+
+def _is_fresh(path, file_path):
+    return os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(file_path)
+
+
+# 由SQL引擎生成的列式副本路径
+def get_sql_columnar_path(file_path):
+    from modules.utils import get_sidecar_path
+    return get_sidecar_path(file_path, ".sql.parquet")
+
+
+# 打开查询连接
+def open_connection(memory_limit_mb=SQL_MEMORY_MB, threads=SQL_THREADS):
+    os.makedirs(SQL_TEMP_DIR, exist_ok=True)
+    return duckdb.connect(":memory:", config={
+        "memory_limit": f"{memory_limit_mb}MB",
+        "threads": threads,
+        "temp_directory": os.path.abspath(SQL_TEMP_DIR)
+    })
+
+
+# 将数据文件转换为Parquet列式副本，返回副本路径
+def convert_to_parquet(file_path):
+    """CSV由DuckDB流式转换，内存占用与文件大小无关；Excel文件通常不大，通过pandas读取后写入列式副本"""
+    from modules.data_cache import get_fresh_columnar_path, load_dataframe
+    sidecar_path = get_fresh_columnar_path(file_path)
+    if sidecar_path:
+        return sidecar_path
+    if not file_path.endswith(".csv"):
+        load_dataframe(file_path)
+        return get_fresh_columnar_path(file_path)
+
+    sidecar_path = get_sql_columnar_path(file_path)
+    if _is_fresh(sidecar_path, file_path):
+        return sidecar_path
+    tmp_path = sidecar_path + ".tmp"
+    con = open_connection()
+    try:
+        con.execute(
+            f"COPY (SELECT * FROM read_csv_auto({_literal(file_path)})) "
+            f"TO {_literal(tmp_path)} (FORMAT parquet, COMPRESSION zstd)"
+        )
+        os.replace(tmp_path, sidecar_path)
+    finally:
+        con.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return sidecar_path
+
+
+def _table_source(file_path):
+    from modules.data_cache import HAS_PYARROW, get_fresh_columnar_path
+    sidecar_path = get_fresh_columnar_path(file_path)
+    if sidecar_path is None and _is_fresh(get_sql_columnar_path(file_path), file_path):
+        sidecar_path = get_sql_columnar_path(file_path)
+    if sidecar_path:
+        return f"read_parquet({_literal(os.path.abspath(sidecar_path))})"
+    if file_path.endswith(".csv"):
+        # 尚未转换的CSV直接扫描（较慢，但不需要读入内存）
+        return f"read_csv_auto({_literal(os.path.abspath(file_path))})"
+    if HAS_PYARROW:
+        sidecar_path = convert_to_parquet(file_path)
+        if sidecar_path:
+            return f"read_parquet({_literal(os.path.abspath(sidecar_path))})"
+    return None
+
+
+# 获取对话中各数据文件对应的数据表
+def get_table_sources(data_files):
+    """data_files 为 文件名 -> 路径，返回 [{"name", "file", "source", "version"}]"""
+    tables = []
+    used = set()
+    for file_name, file_path in sorted(data_files.items()):
+        if not os.path.exists(file_path):
+            continue
+        source = _table_source(file_path)
+        if source is None:
+            continue
+        name = table_name(file_name, used)
+        used.add(name)
+        stat = os.stat(file_path)
+        tables.append({
+            "name": name,
+            "file": file_name,
+            "source": source,
+            "version": f"{stat.st_size}-{stat.st_mtime_ns}"
+        })
+    return tables
+
+
+# 将数据表注册为视图（查询时才扫描文件）
+def create_views(con, tables):
+    for table in tables:
+        con.execute(f"CREATE OR REPLACE VIEW {_identifier(table['name'])} AS SELECT * FROM {table['source']}")
+
+
+# 生成分析代码中使用的 sql() 函数
+def make_sql_helper(con, max_rows=SQL_RESULT_MAX_ROWS):
+    def sql(query):
+        """执行SQL查询，结果以pandas数据框返回"""
+        relation = con.sql(query)
+        if relation is None:
+            return None
+        df = relation.limit(max_rows + 1).df()
+        if len(df) > max_rows:
+            raise ValueError(f"查询结果超过 {max_rows} 行，请先在SQL中过滤或聚合，或使用 LIMIT")
+        return df
+    return sql
+
+
+def _cache_put(cache, key, value):
+    with _cache_lock:
+        if len(cache) >= _CACHE_MAX_ENTRIES:
+            cache.pop(next(iter(cache)))
+        cache[key] = value
+
+
+def _describe_table(con, table):
+    name = _identifier(table["name"])
+    columns = con.execute(f"DESCRIBE SELECT * FROM {name}").fetchall()
+    header = f"表 {table['name']}（文件 {table['file']}"
+    # Parquet 的行数可从元数据读取；未转换的CSV统计行数需要扫描整个文件
+    if table["source"].startswith("read_parquet"):
+        rows = con.execute(f"SELECT count(*) FROM {name}").fetchone()[0]
+        header += f"，{rows} 行"
+    header += f"，{len(columns)} 列）:"
+    return "\n".join([header] + [f"- {column[0]} ({column[1]})" for column in columns])
+
+
+# 数据表说明（用于提示词，只包含表结构），按数据表版本缓存
+def describe_tables(tables):
+    key = tuple((t["name"], t["source"], t["version"]) for t in tables)
+    with _cache_lock:
+        cached = _info_cache.get(key)
+    if cached is not None:
+        return cached
+
+    con = open_connection()
+    try:
+        create_views(con, tables)
+        parts = [_describe_table(con, table) for table in tables]
+    finally:
+        con.close()
+
+    info = "可用数据表（使用 sql() 查询，可跨表连接）:\n\n" + "\n\n".join(parts) + "\n"
+    _cache_put(_info_cache, key, info)
+    return info
+
+
+# 数据表结构指纹（用于回复缓存键）
+def tables_fingerprint(info):
+    return hashlib.sha1(info.encode("utf-8")).hexdigest()
+
+
+# 预览数据表的前几行和行数（行数未知时为 None）
+def preview_table(table, rows):
+    key = (table["source"], table["version"], rows)
+    with _cache_lock:
+        cached = _preview_cache.get(key)
+    if cached is not None:
+        return cached
+
+    con = open_connection()
+    try:
+        create_views(con, [table])
+        name = _identifier(table["name"])
+        df = con.execute(f"SELECT * FROM {name} LIMIT {int(rows)}").df()
+        total = None
+        if table["source"].startswith("read_parquet"):
+            total = con.execute(f"SELECT count(*) FROM {name}").fetchone()[0]
+    finally:
+        con.close()
+
+    preview = (df, total)
+    _cache_put(_preview_cache, key, preview)
+    return preview
@@ -2,20 +2,104 @@ import streamlit as st
 from modules.auth import logout
 from modules.data_manager import (
     handle_file_upload, file_selector, add_to_conversation, 
-    create_new_conversation, load_conversation
+    create_new_conversation, load_conversation, load_conversation_history
 )
-from modules.code_executor import execute_code
-from modules.model_service import generate_analysis_code, generate_chat_response, get_dataframe_info
-from modules.model_config import load_model_config
-from modules.utils import get_user_id
+from modules.model_service import (
+    stream_chat_response, get_dataframe_info, get_dataset_fingerprint, get_question_context
+)
+from modules.job_queue import (
+    JOB_STAGES, get_job, find_active_job, cancel_job, submit_template_analysis, submit_model_analysis,
+    submit_sql_analysis
+)
+from modules.sql_engine import HAS_DUCKDB, get_table_sources, describe_tables, tables_fingerprint
+from modules.model_config import get_model_config
+from modules.data_profile import get_dataset_profile, DEFAULT_SCHEMA_TOKEN_BUDGET
+from modules.intent_router import route_intent
+from modules.conversation_memory import (
+    get_summary_file, build_memory_context, schedule_summary_refresh, clear_summary
+)
+from modules.utils import get_user_id, get_user_conversation_file
+from modules.execution_stats import describe_stats
+from modules import metrics
 from datetime import datetime
 import pandas as pd
 import os
 
-# 显示对话历史
+# 分析任务进度的刷新间隔（秒）；助手回复单独以更短的间隔刷新，尽快显示第一段回复
+JOB_POLL_INTERVAL = 1.0
+JOB_STREAM_INTERVAL = float(os.environ.get("CHATANALYST_JOB_STREAM_INTERVAL", "0.2"))
+
+# 对话区默认显示的消息条数，以及每次加载更早消息的条数
+DISPLAY_RECENT_MESSAGES = 20
+DISPLAY_PAGE_MESSAGES = 20
+
+# 显示图表：默认只加载缩略图，需要时再加载原图
+def show_figure(figure, key):
+    thumbnail = figure.get("thumbnail")
+    # 旧版本的图表只有 temp/ 下的原图
+    if not thumbnail or not os.path.exists(thumbnail):
+        if os.path.exists(figure["path"]):
+            st.image(figure["path"])
+        else:
+            st.caption("图表文件已不存在")
+        return
+    if st.toggle("查看原图", key=key):
+        st.image(figure["path"])
+    else:
+        st.image(thumbnail)
+
+# 显示数据框结果
+def show_dataframe(data):
+    # 从磁盘加载的历史消息中，数据框以 split 格式保存
+    if isinstance(data, dict):
+        data = pd.DataFrame(**data)
+    st.dataframe(data)
+
+# 显示执行结果（key 由对话ID和消息序号组成）；expanded 为 False 时表格和图表只显示开关，打开后才加载
+def show_execution_result(result, key, expanded):
+    if result["output"]:
+        if st.toggle("查看输出", key=f"output_{key}"):
+            st.text(result["output"])
+    
+    if result["error"]:
+        st.error(f"错误: {result['error']}")
+    
+    if result["result"]:
+        if result["result"]["type"] == "figure":
+            if expanded or st.toggle("查看图表", key=f"show_figure_{key}"):
+                show_figure(result["result"], key=f"figure_{key}")
+        elif result["result"]["type"] == "dataframe":
+            data = result["result"]["data"]
+            if expanded:
+                show_dataframe(data)
+            else:
+                label = "查看结果表格"
+                if isinstance(data, dict) and "index" in data:
+                    label += f"（{len(data['index'])} 行 × {len(data.get('columns', []))} 列）"
+                if st.toggle(label, key=f"show_table_{key}"):
+                    show_dataframe(data)
+    
+    # 资源占用（早期保存的结果没有这项统计）
+    if result.get("stats"):
+        st.caption(describe_stats(result["stats"]))
+
+# 显示对话历史（只显示最近的消息，更早的消息按需加载）
 def display_conversation():
-    # 创建聊天消息容器
-    for message in st.session_state.conversation_history:
+    history = st.session_state.conversation_history
+    windows = st.session_state.setdefault("display_windows", {})
+    window = windows.get(get_user_id(), DISPLAY_RECENT_MESSAGES)
+    start = max(len(history) - window, 0)
+    
+    if start > 0:
+        if st.button(f"加载更早的消息（还有 {start} 条）", key="load_earlier_messages"):
+            windows[get_user_id()] = window + DISPLAY_PAGE_MESSAGES
+            st.rerun()
+    
+    # 最后一条助手消息直接显示结果，更早的结果默认折叠
+    last_assistant = max((i for i in range(start, len(history)) if history[i]["role"] == "assistant"), default=None)
+    
+    for index in range(start, len(history)):
+        message = history[index]
         role = message["role"]
         content = message["content"]
         
@@ -31,88 +115,140 @@ def display_conversation():
                 #         st.code(message["code"], language="python")
                 
                 if "execution_result" in message:
-                    result = message["execution_result"]
-                    
-                    if result["output"]:
-                        with st.expander("查看输出"):
-                            st.text(result["output"])
-                    
-                    if result["error"]:
-                        st.error(f"错误: {result['error']}")
-                    
-                    if result["result"]:
-                        if result["result"]["type"] == "figure":
-                            st.image(result["result"]["path"])
-                        elif result["result"]["type"] == "dataframe":
-                            st.dataframe(result["result"]["data"])
+                    # 控件键包含对话ID，切换或新建对话时不沿用其他对话的展开状态
+                    show_execution_result(
+                        message["execution_result"], key=f"{get_user_id()}_{index}", expanded=index == last_assistant
+                    )
         elif role == "system":
             st.chat_message("system", avatar="🔧").write(content)
 
+# 分析任务结束后重新加载对话
+def _reload_after_job():
+    st.session_state.pop("watched_job_id", None)
+    st.session_state.conversation_history = load_conversation_history(get_user_id())
+    # 较早的消息积累到一定数量时在后台更新摘要
+    summary_file = get_summary_file(get_user_conversation_file(get_user_id()))
+    schedule_summary_refresh(summary_file, st.session_state.conversation_history, get_model_config())
+    st.rerun()
+
+# 显示分析任务的进度（定时刷新，任务结束后重新加载对话）
+@st.fragment(run_every=JOB_POLL_INTERVAL)
+def show_job_progress(job_id):
+    job = get_job(job_id)
+    if job is None or job.finished:
+        _reload_after_job()
+    
+    with st.chat_message("assistant"):
+        stages = list(JOB_STAGES)
+        st.progress(stages.index(job.stage) / len(stages), text=JOB_STAGES[job.stage])
+        _show_partial_response(job_id)
+        if job.cancel_requested:
+            st.caption("正在取消...")
+        elif st.button("取消分析", key=f"cancel_{job_id}"):
+            cancel_job(job_id)
+
+# 显示正在生成的助手回复（嵌套在进度片段中，刷新更频繁）
+@st.fragment(run_every=JOB_STREAM_INTERVAL)
+def _show_partial_response(job_id):
+    job = get_job(job_id)
+    if job is None or job.finished:
+        _reload_after_job()
+    if job.partial_response:
+        st.write(job.partial_response)
+
+# 收到第一段回复时清除“正在思考”提示
+def _clear_on_first_delta(stream, placeholder):
+    first = True
+    for delta in stream:
+        if first:
+            placeholder.empty()
+            first = False
+        yield delta
+
 # 用户输入处理
 def handle_user_input():
+    # 当前对话有未完成的分析任务时显示进度，任务结束前不接受新的输入
+    active_job = find_active_job(st.session_state.get("username"), get_user_id())
+    if active_job:
+        st.session_state.watched_job_id = active_job.id
+        show_job_progress(active_job.id)
+    elif st.session_state.get("watched_job_id"):
+        # 任务在两次进度刷新之间（或提交后的第一次刷新前）结束时，同样需要加载结果
+        _reload_after_job()
+    
     # 使用聊天输入替代文本框和提交按钮
-    user_input = st.chat_input("请输入您的数据分析需求...")
+    user_input = st.chat_input("请输入您的数据分析需求...", disabled=active_job is not None)
     
     if user_input:
+        metrics.start_turn(kind="chat", conversation=get_user_id())
         # 添加用户消息到对话历史
         add_to_conversation("user", user_input)
+        config = get_model_config()
+        # 最近几轮原文 + 较早对话的摘要，长度不随对话轮数增长
+        summary_file = get_summary_file(get_user_conversation_file(get_user_id()))
+        memory_context = build_memory_context(summary_file, st.session_state.conversation_history)
         
-        # 生成并执行代码
-        if st.session_state.current_df is not None:
-            # 创建占位符用于流式输出
-            assistant_placeholder = st.chat_message("assistant")
-            thinking_placeholder = assistant_placeholder.empty()
-            thinking_placeholder.write("正在分析数据...")
-            
-            # 获取数据框信息
-            df_info = get_dataframe_info(st.session_state.current_df)
-            
-            # 生成分析代码
-            code = generate_analysis_code(user_input, df_info)
-            
-            # 执行代码
-            execution_result = execute_code(code, get_user_id())
-            
-            # 生成助手回复
-            assistant_response = generate_chat_response(
-                st.session_state.conversation_history[-1:],  # 只传入最后一条用户消息
-                df_info
+        # 分析任务提交到后台队列，页面定时查询进度，刷新或离开页面不影响任务
+        if st.session_state.get("sql_engine") and st.session_state.data_files:
+            # SQL 引擎：对话中的所有数据文件注册为数据表，由模型生成SQL查询代码
+            metrics.annotate(kind="analysis_sql")
+            tables = get_table_sources(st.session_state.data_files)
+            tables_info = describe_tables(tables)
+            job = submit_sql_analysis(
+                st.session_state.get("username"), get_user_id(), user_input, memory_context, tables_info, config,
+                tables, tables_fingerprint(tables_info)
             )
+            st.session_state.watched_job_id = job.id
+            metrics.detach_turn()
+        elif st.session_state.current_df is not None:
+            username = st.session_state.get("username")
+            file_path = st.session_state.data_files.get(st.session_state.current_file_name)
             
-            # 使用占位符显示最终回复
-            thinking_placeholder.empty()
-            assistant_placeholder.write(assistant_response)
-            
-            # 显示执行结果
-            if execution_result:
-                if execution_result.get("error"):
-                    assistant_placeholder.error(f"错误: {execution_result['error']}")
-                if execution_result.get("result"):
-                    result = execution_result["result"]
-                    if result["type"] == "figure":
-                        assistant_placeholder.image(result["path"])
-                    elif result["type"] == "dataframe":
-                        assistant_placeholder.dataframe(result["data"])
-            
-            # 添加助手消息到对话历史
-            add_to_conversation("assistant", assistant_response, code, execution_result)
+            # 常规分析直接使用本地模板，不调用模型
+            intent = route_intent(user_input, get_dataset_profile(st.session_state.current_df, file_path))
+            if intent:
+                metrics.annotate(kind="analysis_template", intent=intent["intent"])
+                job = submit_template_analysis(
+                    username, get_user_id(), intent["code"], intent["label"],
+                    st.session_state.current_df, file_path
+                )
+            else:
+                metrics.annotate(kind="analysis_model")
+                # 获取数据框信息：概况与问题无关，保证同一数据集上的提示词前缀不变；
+                # 与问题相关的列信息单独附在问题之后
+                token_budget = config.get("schema_token_budget", DEFAULT_SCHEMA_TOKEN_BUDGET)
+                df_info = get_dataframe_info(st.session_state.current_df, file_path, token_budget=token_budget)
+                question_context = get_question_context(st.session_state.current_df, file_path, user_input, token_budget)
+                dataset_fingerprint = get_dataset_fingerprint(st.session_state.current_df, file_path)
+                
+                job = submit_model_analysis(
+                    username, get_user_id(), user_input, memory_context, df_info, config,
+                    st.session_state.current_df, file_path, dataset_fingerprint, question_context
+                )
+            st.session_state.watched_job_id = job.id
+            # 这一轮由后台任务结束时记录
+            metrics.detach_turn()
         else:
             # 创建占位符用于流式输出
             assistant_placeholder = st.chat_message("assistant")
             thinking_placeholder = assistant_placeholder.empty()
             thinking_placeholder.write("正在思考...")
             
-            # 生成助手回复（无数据情况）
-            assistant_response = generate_chat_response(
-                st.session_state.conversation_history[-1:]  # 只传入最后一条用户消息
-            )
-            
-            # 使用占位符显示最终回复
-            thinking_placeholder.empty()
-            assistant_placeholder.write(assistant_response)
+            # 流式生成助手回复（无数据情况）
+            assistant_response = assistant_placeholder.write_stream(_clear_on_first_delta(
+                stream_chat_response(
+                    memory_context,
+                    config=config
+                ),
+                thinking_placeholder
+            ))
             
             # 添加助手消息到对话历史
             add_to_conversation("assistant", assistant_response)
+            
+            # 较早的消息积累到一定数量时在后台更新摘要
+            schedule_summary_refresh(summary_file, st.session_state.conversation_history, config)
+            metrics.finish_turn(status="done")
         
         # 刷新页面显示新消息
         st.rerun()
@@ -158,6 +294,7 @@ def render_main_ui():
             st.session_state.conversation_history = []
             from modules.data_manager import save_conversation_history
             save_conversation_history(get_user_id(), [])
+            clear_summary(get_summary_file(get_user_conversation_file(get_user_id())))
             st.success("对话历史已清空!")
             st.rerun()
 
@@ -168,13 +305,16 @@ def render_main_ui():
         # 分隔线
         st.divider()
         
+        # 大文件改用SQL引擎查询，不加载到内存（需要安装duckdb）
+        if HAS_DUCKDB:
+            st.toggle(
+                "大文件模式（SQL 查询）", key="sql_engine",
+                help="数据文件在磁盘上按需扫描，只把查询结果读入内存，可跨文件连接查询"
+            )
+        
         # 文件上传和选择
         handle_file_upload()
         file_selector()
-        
-        # 确保模型配置已加载（但不在UI中显示）
-        if 'model_config' not in st.session_state:
-            st.session_state.model_config = load_model_config()
     
     # 主内容区域
     st.title("💬 智能数据分析系统")
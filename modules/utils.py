@@ -5,14 +5,23 @@ import time
 from datetime import datetime
 import io
 from contextlib import redirect_stdout
+import re
 import streamlit as st
 
+try:
+    import tiktoken
+    _token_encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _token_encoding = None
+
 # 创建必要的目录结构
 def create_directories():
     os.makedirs("data", exist_ok=True)
     os.makedirs("conversations", exist_ok=True)
     os.makedirs("temp", exist_ok=True)
     os.makedirs("users", exist_ok=True)
+    os.makedirs("cache", exist_ok=True)
+    os.makedirs("figures", exist_ok=True)
 
 # 生成带日期的对话ID
 def generate_conversation_id():
@@ -45,17 +54,33 @@ def get_user_conversation_dir(username):
     os.makedirs(user_conv_dir, exist_ok=True)
     return user_conv_dir
 
-def get_user_conversation_file(user_id):
-    """获取用户对话历史文件路径"""
-    if 'username' in st.session_state:
-        username = st.session_state.username
+def get_conversation_file(username, conversation_id):
+    """获取指定用户对话的历史文件路径（不依赖会话状态）"""
+    if username:
         user_conv_dir = get_user_conversation_dir(username)
-        return f"{user_conv_dir}/{user_id}.json"
+        return f"{user_conv_dir}/{conversation_id}.json"
     else:
         # 未登录用户或临时会话使用旧路径
-        return f"conversations/{user_id}.json"
+        return f"conversations/{conversation_id}.json"
+
+def get_user_conversation_file(user_id):
+    """获取用户对话历史文件路径"""
+    return get_conversation_file(st.session_state.get('username'), user_id)
 
 def get_file_path(username, conversation_id, filename):
     """获取文件存储路径"""
     user_data_dir = get_user_data_dir(username, conversation_id)
-    return f"{user_data_dir}/{filename}" 
\ No newline at end of file
+    return f"{user_data_dir}/{filename}"
+
+def get_sidecar_path(file_path, suffix):
+    """获取数据文件的附属文件路径（存放在同目录的 .cache 子目录中）"""
+    sidecar_dir = os.path.join(os.path.dirname(file_path), ".cache")
+    os.makedirs(sidecar_dir, exist_ok=True)
+    return os.path.join(sidecar_dir, os.path.basename(file_path) + suffix)
+
+def estimate_tokens(text):
+    """估算文本的token数：安装了tiktoken时使用分词器，否则按中文每字1个、其他字符每4个1个估算"""
+    if _token_encoding is not None:
+        return len(_token_encoding.encode(text, disallowed_special=()))
+    cjk = len(re.findall(r"[\u3000-\u9fff\uff00-\uffef]", text))
+    return cjk + (len(text) - cjk + 3) // 4
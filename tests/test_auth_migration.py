@@ -0,0 +1,69 @@
+import json
+import sqlite3
+import threading
+
+from modules import auth
+
+
+def _use_tmp_files(monkeypatch, tmp_path):
+    legacy_file = tmp_path / "users.json"
+    legacy_file.write_text(json.dumps({
+        f"user{i}": {"password_hash": auth.hash_password("secret"), "created_at": "2024-01-01 00:00:00"}
+        for i in range(5)
+    }))
+    monkeypatch.setattr(auth, "USER_DB_FILE", str(tmp_path / "users.db"))
+    monkeypatch.setattr(auth, "LEGACY_USER_FILE", str(legacy_file))
+    monkeypatch.setattr(auth, "_schema_ready", False)
+    return legacy_file
+
+
+def test_parallel_migrations_run_once(monkeypatch, tmp_path):
+    legacy_file = _use_tmp_files(monkeypatch, tmp_path)
+    auth._connect().close()
+    conn = sqlite3.connect(auth.USER_DB_FILE)
+    with conn:
+        conn.execute("DELETE FROM meta")
+        conn.execute("DELETE FROM users")
+    conn.close()
+    errors = []
+
+    # 模拟多个进程同时首次打开数据库：各自使用独立连接执行迁移
+    def migrate():
+        conn = sqlite3.connect(auth.USER_DB_FILE, timeout=10)
+        try:
+            auth._migrate_legacy_users(conn)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            conn.close()
+
+    threads = [threading.Thread(target=migrate) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert auth.get_user("user0") is not None
+    # 迁移不修改（可能受版本控制的）users.json
+    assert legacy_file.exists()
+
+
+def test_migration_does_not_reimport_deleted_users(monkeypatch, tmp_path):
+    _use_tmp_files(monkeypatch, tmp_path)
+    assert auth.get_user("user1") is not None
+    conn = sqlite3.connect(auth.USER_DB_FILE)
+    with conn:
+        conn.execute("DELETE FROM users WHERE username = 'user1'")
+    conn.close()
+
+    # 进程重启后不会再次导入 users.json
+    monkeypatch.setattr(auth, "_schema_ready", False)
+    assert auth.get_user("user1") is None
+
+
+def test_login_updates_last_login(monkeypatch, tmp_path):
+    _use_tmp_files(monkeypatch, tmp_path)
+    assert auth.authenticate_user("user2", "secret") == (True, "登录成功")
+    assert auth.get_user("user2")["last_login"] is not None
+    assert auth.register_user("user2", "other") == (False, "用户名已存在")
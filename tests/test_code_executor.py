@@ -0,0 +1,27 @@
+import pandas as pd
+
+from modules.code_executor import execute_code_inline
+from modules.data_cache import load_dataframe
+
+
+def test_inline_execution_does_not_modify_cached_dataframe(tmp_path):
+    file_path = str(tmp_path / "sales.csv")
+    pd.DataFrame({"city": ["a", "b", "c"], "sales": [1.0, None, 3.0]}).to_csv(file_path, index=False)
+    df = load_dataframe(file_path)
+    expected = df.copy()
+
+    code = """
+df.loc[0, "sales"] = 100
+df["extra"] = 1
+df.fillna(0, inplace=True)
+df.drop(columns=["city"], inplace=True)
+result_df = df
+"""
+    result = execute_code_inline(code, "user", df)
+    assert result["error"] is None
+    assert list(result["result"]["data"].columns) == ["sales", "extra"]
+
+    # 缓存中的数据框（其他会话共用）保持不变
+    cached = load_dataframe(file_path)
+    assert cached is df
+    pd.testing.assert_frame_equal(cached, expected)
@@ -0,0 +1,45 @@
+import json
+
+from modules import conversation_catalog
+from modules.conversation_catalog import count_conversations, query_conversations
+
+
+def _write_conversation(conv_dir, conv_id, content):
+    (conv_dir / f"{conv_id}.json").write_text(
+        json.dumps([{"role": "user", "content": content, "timestamp": "2024-01-01 00:00:00"}]),
+        encoding="utf-8"
+    )
+
+
+def test_migration_skips_bad_files_and_runs_once(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    conv_dir = tmp_path / "conversations" / "alice"
+    conv_dir.mkdir(parents=True)
+    _write_conversation(conv_dir, "20240101_000000", "第一个问题")
+    _write_conversation(conv_dir, "20240102_000000", "第二个问题")
+    # 无法解析的对话文件照常列出，不中断迁移
+    (conv_dir / "20240103_000000.json").write_bytes(b"\xff\xfe{not json")
+
+    titles = {c["id"]: c["title"] for c in query_conversations("alice")}
+    assert titles["20240101_000000"] == "第一个问题"
+    assert titles["20240102_000000"] == "第二个问题"
+    assert "20240103_000000" in titles
+
+    # 迁移已在索引库中记录，之后新增的文件不会被再次扫描
+    _write_conversation(conv_dir, "20240104_000000", "第四个问题")
+    assert count_conversations("alice") == 3
+
+
+def test_catalog_without_migration_record_is_rebuilt(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    conv_dir = tmp_path / "conversations" / "bob"
+    conv_dir.mkdir(parents=True)
+    _write_conversation(conv_dir, "20240101_000000", "问题")
+    # 迁移中断时留下的索引库（没有完成记录）在下次打开时重新迁移
+    conn, _ = conversation_catalog._connect("bob")
+    with conn:
+        conn.execute("DELETE FROM conversations")
+        conn.execute("DELETE FROM meta")
+    conn.close()
+
+    assert count_conversations("bob") == 1
@@ -0,0 +1,51 @@
+import threading
+
+from modules.data_manager import (
+    LOG_COMPACT_MIN_LINES, _append_to_conversation_file, _write_snapshot, read_conversation_file
+)
+
+
+def _message(writer, i):
+    return {"role": "assistant", "content": f"{writer}-{i}", "timestamp": "2024-01-01 00:00:00"}
+
+
+def test_compaction_keeps_messages_appended_elsewhere(tmp_path):
+    snapshot_path = str(tmp_path / "conv.json")
+    _write_snapshot(snapshot_path, [_message("initial", i) for i in range(5)])
+    # 后台任务追加的消息不在调用方的历史中，压缩后仍然保留
+    for i in range(LOG_COMPACT_MIN_LINES * 3):
+        _append_to_conversation_file(snapshot_path, _message("job", i))
+    history = read_conversation_file(snapshot_path)
+    assert [m["content"] for m in history] == (
+        [f"initial-{i}" for i in range(5)] + [f"job-{i}" for i in range(LOG_COMPACT_MIN_LINES * 3)]
+    )
+
+
+def test_concurrent_appends_and_reads(tmp_path):
+    snapshot_path = str(tmp_path / "conv.json")
+    _write_snapshot(snapshot_path, [])
+    writers, per_writer = 4, LOG_COMPACT_MIN_LINES * 2
+    stop = threading.Event()
+
+    def write(writer):
+        for i in range(per_writer):
+            _append_to_conversation_file(snapshot_path, _message(writer, i))
+
+    def read():
+        while not stop.is_set():
+            read_conversation_file(snapshot_path)
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    threads = [threading.Thread(target=write, args=(w,)) for w in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stop.set()
+    reader.join()
+
+    contents = [m["content"] for m in read_conversation_file(snapshot_path)]
+    assert sorted(contents) == sorted(f"{w}-{i}" for w in range(writers) for i in range(per_writer))
+    for w in range(writers):
+        assert [c for c in contents if c.startswith(f"{w}-")] == [f"{w}-{i}" for i in range(per_writer)]
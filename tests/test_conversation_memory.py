@@ -0,0 +1,48 @@
+import json
+
+from modules import conversation_memory
+from modules.conversation_memory import (
+    MEMORY_MAX_UNSUMMARIZED, MEMORY_RECENT_MESSAGES, build_memory_context, load_summary, _refresh_summary
+)
+
+
+def _history(count):
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": f"m{i}"} for i in range(count)]
+
+
+def _write_summary(path, text, covered):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"summary": text, "covered": covered}, f)
+
+
+def test_keeps_all_messages_before_first_summary(tmp_path):
+    context = build_memory_context(str(tmp_path / "c.summary"), _history(9))
+    assert [m["content"] for m in context] == [f"m{i}" for i in range(9)]
+
+
+def test_keeps_messages_between_summary_and_recent_window(tmp_path):
+    summary_file = str(tmp_path / "c.summary")
+    _write_summary(summary_file, "早期摘要", 4)
+    context = build_memory_context(summary_file, _history(4 + MEMORY_RECENT_MESSAGES + 3))
+    assert context[0]["content"].endswith("早期摘要")
+    assert [m["content"] for m in context[1:]] == [f"m{i}" for i in range(4, 4 + MEMORY_RECENT_MESSAGES + 3)]
+
+
+def test_long_unsummarized_history_is_capped_with_a_note(tmp_path):
+    context = build_memory_context(str(tmp_path / "c.summary"), _history(100))
+    assert "尚未纳入摘要" in context[0]["content"]
+    assert [m["content"] for m in context[1:]] == [f"m{i}" for i in range(100 - MEMORY_MAX_UNSUMMARIZED, 100)]
+
+
+def test_refresh_goes_through_model_service(tmp_path, monkeypatch):
+    calls = []
+
+    def fake_completion(messages, config, kind, temperature=None, max_tokens=None):
+        calls.append((kind, temperature, max_tokens))
+        return " 新摘要 "
+
+    monkeypatch.setattr(conversation_memory, "generate_completion", fake_completion)
+    summary_file = str(tmp_path / "c.summary")
+    _refresh_summary(summary_file, _history(4), {"model_name": "m"})
+    assert calls == [("summary", 0, conversation_memory.SUMMARY_MAX_TOKENS)]
+    assert load_summary(summary_file) == {"summary": "新摘要", "covered": 4}
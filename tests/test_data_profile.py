@@ -0,0 +1,25 @@
+import pandas as pd
+
+from modules import data_profile
+
+
+def test_profile_cache_is_bounded(monkeypatch, tmp_path):
+    monkeypatch.setattr(data_profile, "PROFILE_CACHE_MAX_ENTRIES", 3)
+    monkeypatch.setattr(data_profile, "_profile_cache", data_profile.OrderedDict())
+    df = pd.DataFrame({"a": [1, 2, 3]})
+    paths = []
+    for i in range(5):
+        path = tmp_path / f"data{i}.csv"
+        df.to_csv(path, index=False)
+        paths.append(str(path))
+
+    for path in paths[:3]:
+        data_profile.get_dataset_profile(df, path)
+    # 最近使用过的概况保留，最久未用的被淘汰
+    data_profile.get_dataset_profile(df, paths[0])
+    for path in paths[3:]:
+        data_profile.get_dataset_profile(df, path)
+
+    assert list(data_profile._profile_cache) == [paths[0], paths[3], paths[4]]
+    # 淘汰后从附属文件恢复
+    assert data_profile.get_dataset_profile(df, paths[1])["rows"] == 3
@@ -0,0 +1,34 @@
+import pytest
+
+from modules.executor_pool import ExecutorPool
+
+
+def _job(code, memory_limit_mb=1024):
+    return {"code": code, "user_id": "test", "dataset": None, "tables": None, "memory_limit_mb": memory_limit_mb}
+
+
+@pytest.fixture(scope="module")
+def pool():
+    pool = ExecutorPool(1)
+    yield pool
+    pool.shutdown()
+
+
+def test_timeout_kills_and_replaces_worker(pool):
+    result = pool.run(_job("import time\ntime.sleep(60)"), timeout=2)
+    assert "超时" in result["error"]
+    assert result["stats"]["wall_seconds"] < 30
+
+    # 被终止的工作进程已替换，后续任务正常执行
+    result = pool.run(_job("print('ok')"), timeout=60)
+    assert result["error"] is None
+    assert result["output"] == "ok\n"
+
+
+def test_memory_limit_returns_error(pool):
+    result = pool.run(_job("data = bytearray(4 * 1024 ** 3)", memory_limit_mb=256), timeout=60)
+    assert result["error"] == "代码执行超出内存限制 (256 MB)"
+
+    # 内存限制只在执行代码期间生效
+    result = pool.run(_job("data = bytearray(512 * 1024 ** 2)\nprint(len(data))"), timeout=60)
+    assert result["error"] is None
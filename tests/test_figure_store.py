@@ -0,0 +1,71 @@
+import os
+
+import matplotlib
+matplotlib.use("Agg")
+
+import matplotlib.pyplot as plt
+import pytest
+
+from modules import figure_store
+
+
+@pytest.fixture(autouse=True)
+def figure_dir(monkeypatch, tmp_path):
+    monkeypatch.setattr(figure_store, "FIGURE_DIR", str(tmp_path / "figures"))
+    monkeypatch.setattr(figure_store, "INDEX_FILE", str(tmp_path / "figures" / "index.db"))
+
+
+def _save_plot(values):
+    fig = plt.figure(figsize=(4, 3))
+    try:
+        plt.plot(values)
+        return figure_store.save_figure(fig)
+    finally:
+        plt.close(fig)
+
+
+def _figure_count():
+    conn = figure_store._connect()
+    try:
+        return conn.execute("SELECT COUNT(*) FROM figures").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_identical_figures_are_stored_once():
+    first = _save_plot([1, 2, 3])
+    second = _save_plot([1, 2, 3])
+    other = _save_plot([3, 2, 1])
+
+    assert first == second
+    assert other["figure_id"] != first["figure_id"]
+    assert _figure_count() == 2
+    assert os.path.exists(first["path"]) and os.path.exists(first["thumbnail"])
+    assert os.path.getsize(first["thumbnail"]) < os.path.getsize(first["path"])
+
+
+def test_garbage_collection_keeps_referenced_figures():
+    kept = _save_plot([1, 2, 3])
+    dropped = _save_plot([3, 2, 1])
+    figure_store.add_figure_references("conv-a", {kept["figure_id"], dropped["figure_id"]})
+    figure_store.add_figure_references("conv-b", {kept["figure_id"]})
+
+    assert figure_store.collect_garbage(grace=0) == 0
+
+    # 对话被覆盖后不再引用 dropped，另一个对话仍然引用 kept
+    figure_store.set_figure_references("conv-a", set())
+    assert figure_store.collect_garbage(grace=0) == 1
+    assert not os.path.exists(dropped["path"]) and not os.path.exists(dropped["thumbnail"])
+    assert os.path.exists(kept["path"])
+
+
+def test_garbage_collection_waits_for_grace_period():
+    figure = _save_plot([1, 2, 3])
+
+    # 刚保存、尚未写入对话的图表不会被回收
+    assert figure_store.collect_garbage() == 0
+    assert os.path.exists(figure["path"])
+
+    assert figure_store.collect_garbage(grace=0) == 1
+    assert not os.path.exists(figure["path"])
+    assert _figure_count() == 0
@@ -0,0 +1,86 @@
+import matplotlib
+matplotlib.use("Agg")
+
+import numpy as np
+import pandas as pd
+import pytest
+import matplotlib.pyplot as plt
+import seaborn as sns
+
+from modules.intent_router import route_intent
+
+# 测试环境可能没有中文字体
+pytestmark = pytest.mark.filterwarnings("ignore:Glyph")
+
+
+def _profile(columns, numeric=()):
+    return {
+        "rows": 10,
+        "cols": len(columns),
+        "columns": [{"name": name, "dtype": "float64" if name in numeric else "object", "missing": 0}
+                    for name in columns],
+        "numeric": {name: {"mean": 0.0, "min": 0.0, "max": 1.0} for name in numeric}
+    }
+
+
+PROFILE = _profile(["city", "sales", "price", "quantity"], numeric=["sales", "price", "quantity"])
+
+
+@pytest.mark.parametrize("question, intent", [
+    ("描述统计", "describe"),
+    ("统计一下", "describe"),
+    ("计算相关性", "correlation"),
+    ("sales和price的相关系数", "correlation"),
+    ("画出sales的直方图", "histogram"),
+    ("看看sales的分布", "histogram"),
+    ("查看缺失值", "missing"),
+    ("数据概览", "overview"),
+    ("看看各列的缺失值", "missing"),
+    ("sales的描述统计信息", "describe"),
+])
+def test_routes_common_questions(question, intent):
+    match = route_intent(question, PROFILE)
+    assert match is not None
+    assert match["intent"] == intent
+
+
+@pytest.mark.parametrize("question", [
+    "统计北京的订单数量",
+    "统计sales大于100的记录数",
+    "找出和sales相关的异常订单",
+    "缺失值用均值填充后重新计算相关性",
+    "销售额的分布在哪个城市最集中",
+    "统计北京订单",
+    "按照city分组统计sales",
+])
+def test_specific_questions_fall_back_to_model(question):
+    assert route_intent(question, PROFILE) is None
+
+
+# 明确短语之外还有分组、筛选、修改数据或变换等要求时，模板给不出正确答案
+@pytest.mark.parametrize("question", [
+    "按city统计sales的描述统计",
+    "各城市sales的直方图",
+    "删除缺失值",
+    "对sales做log变换后画直方图",
+    "2023年sales的描述统计",
+    "相关性分析后绘制回归线",
+    "描述统计并标出销售额偏低的门店",
+])
+def test_strong_phrases_with_extra_requirements_fall_back_to_model(question):
+    assert route_intent(question, PROFILE) is None
+
+
+# 概况中的列名是字符串，数据中的列标签可能是数字（例如以年份为表头的Excel）
+@pytest.mark.parametrize("question", ["2020和2021的相关性", "2020的直方图", "2020的描述统计", "2020的缺失值"])
+def test_templates_select_non_string_labels(question):
+    df = pd.DataFrame(np.random.rand(20, 3), columns=[2020, 2021, 2022])
+    match = route_intent(question, _profile(["2020", "2021", "2022"], numeric=["2020", "2021", "2022"]))
+    assert match is not None
+    local_vars = {"pd": pd, "np": np, "plt": plt, "sns": sns, "df": df}
+    try:
+        exec(match["code"], local_vars)
+    finally:
+        plt.close("all")
+    if "result_df" in local_vars:
+        assert not local_vars["result_df"].empty
@@ -0,0 +1,98 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from modules import job_queue
+
+
+@pytest.fixture
+def messages(monkeypatch):
+    """记录写入对话的消息，不写入磁盘"""
+    recorded = []
+    monkeypatch.setattr(
+        job_queue, "add_message_to_conversation",
+        lambda username, conversation_id, role, content, code=None, execution_result=None:
+            recorded.append({"role": role, "content": content, "code": code, "execution_result": execution_result})
+    )
+    return recorded
+
+
+def _wait(job):
+    job.future.result(timeout=10)
+    return job
+
+
+def test_model_pipeline_reports_stages(monkeypatch, messages):
+    stages = {}
+
+    def generate(*args):
+        stages["generate"] = job_queue.find_active_job("alice", "conv").stage
+        return "print('ok')"
+
+    def execute(code, user_id, df, file_path, tables):
+        stages["execute"] = job_queue.find_active_job("alice", "conv").stage
+        return {"output": "ok\n", "result": None, "error": None}
+
+    monkeypatch.setattr(job_queue, "generate_analysis_code", generate)
+    monkeypatch.setattr(job_queue, "execute_code_on", execute)
+    monkeypatch.setattr(job_queue, "stream_chat_response", lambda *args: iter(["分析", "完成"]))
+
+    job = job_queue.submit_model_analysis("alice", "conv", "问题", [], "数据说明", {}, None, None, "fp", None)
+    _wait(job)
+
+    assert stages == {"generate": "generating", "execute": "executing"}
+    assert job.stage == "summarizing"
+    assert job.status == "done"
+    assert messages == [{"role": "assistant", "content": "分析完成", "code": "print('ok')",
+                         "execution_result": {"output": "ok\n", "result": None, "error": None}}]
+    assert job_queue.find_active_job("alice", "conv") is None
+
+
+def test_cancel_running_job_stops_at_next_stage(messages):
+    started, release = threading.Event(), threading.Event()
+
+    def pipeline(job):
+        job.set_stage("generating")
+        started.set()
+        release.wait(10)
+        job.set_stage("executing")
+        raise AssertionError("取消后不应继续执行")
+
+    job = job_queue.submit_job("alice", "conv-running", pipeline)
+    assert started.wait(10)
+    assert job_queue.find_active_job("alice", "conv-running") is job
+    job_queue.cancel_job(job.id)
+    release.set()
+    _wait(job)
+
+    assert job.status == "cancelled"
+    assert job.stage == "generating"
+    assert messages == [{"role": "system", "content": "已取消本次分析。", "code": None, "execution_result": None}]
+
+
+def test_cancel_queued_job_never_runs(monkeypatch, messages):
+    monkeypatch.setattr(job_queue, "_job_executor", ThreadPoolExecutor(max_workers=1))
+    release = threading.Event()
+    blocker = job_queue.submit_job("alice", "conv-a", lambda job: release.wait(10))
+    queued = job_queue.submit_job("alice", "conv-b", lambda job: messages.append("ran"))
+
+    job_queue.cancel_job(queued.id)
+    assert queued.status == "cancelled"
+    release.set()
+    _wait(blocker)
+
+    assert queued.future.cancelled()
+    assert "ran" not in messages
+
+
+def test_failed_pipeline_reports_error(messages):
+    def pipeline(job):
+        job.set_stage("executing")
+        raise RuntimeError("出错了")
+
+    job = _wait(job_queue.submit_job("alice", "conv-failed", pipeline))
+
+    assert job.status == "failed"
+    assert job.error == "出错了"
+    assert messages[-1]["content"] == "分析过程中出错: 出错了"
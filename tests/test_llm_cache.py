@@ -0,0 +1,55 @@
+import sqlite3
+
+from modules import llm_cache
+
+
+def _use_tmp_cache(monkeypatch, tmp_path, max_bytes):
+    monkeypatch.setattr(llm_cache, "CACHE_FILE", str(tmp_path / "llm_cache.db"))
+    monkeypatch.setattr(llm_cache, "LLM_CACHE_MAX_MB", max_bytes / (1024 * 1024))
+    monkeypatch.setattr(llm_cache, "_schema_ready", False)
+
+
+def _sizes(tmp_path):
+    conn = sqlite3.connect(tmp_path / "llm_cache.db")
+    try:
+        total = conn.execute("SELECT value FROM meta WHERE key = 'total_size'").fetchone()[0]
+        actual = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+    finally:
+        conn.close()
+    return total, actual
+
+
+def test_running_total_tracks_writes_and_deletes(monkeypatch, tmp_path):
+    _use_tmp_cache(monkeypatch, tmp_path, 1000)
+    llm_cache.put_cached_response("a", "x" * 100)
+    llm_cache.put_cached_response("b", "x" * 200)
+    # 覆盖已有条目时按新旧大小差值更新
+    llm_cache.put_cached_response("a", "x" * 50)
+    assert _sizes(tmp_path) == (250, 250)
+
+    llm_cache.clear_cache()
+    assert _sizes(tmp_path) == (0, 0)
+
+
+def test_eviction_keeps_recent_entries_under_cap(monkeypatch, tmp_path):
+    _use_tmp_cache(monkeypatch, tmp_path, 1000)
+    for i in range(12):
+        llm_cache.put_cached_response(f"key{i}", "x" * 100)
+
+    total, actual = _sizes(tmp_path)
+    assert total == actual <= 1000
+    assert llm_cache.get_cached_response("key11") is not None
+    assert llm_cache.get_cached_response("key0") is None
+
+
+def test_failed_code_is_removed_from_cache(monkeypatch, tmp_path):
+    from modules.model_service import invalidate_analysis_code
+    from modules.prompt_builder import build_code_messages
+
+    _use_tmp_cache(monkeypatch, tmp_path, 1000)
+    config = {"model_name": "test", "temperature": 0, "max_tokens": 100, "system_prompt": "prompt"}
+    key = llm_cache.make_cache_key(config, build_code_messages("问题", "数据说明", config), "fp")
+    llm_cache.put_cached_response(key, "raise ValueError()")
+
+    invalidate_analysis_code("问题", "数据说明", config, "fp")
+    assert llm_cache.get_cached_response(key) is None
@@ -0,0 +1,17 @@
+from modules import metrics
+from modules.prompt_builder import build_chat_messages, build_code_messages, prefix_hash
+
+
+def test_prefix_hash_is_recorded_in_the_turn_log(monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_ENABLED", True)
+    config = {"system_prompt": "prompt"}
+    turn = metrics.start_turn(kind="chat")
+    try:
+        code_messages = build_code_messages("问题", "数据说明", config)
+        build_chat_messages([{"role": "user", "content": "问题"}], "数据说明", config)
+    finally:
+        metrics._current_turn.set(None)
+
+    # 两类调用共用同一前缀
+    assert turn.fields["code_prefix_hash"] == prefix_hash(code_messages[0])
+    assert turn.fields["chat_prefix_hash"] == turn.fields["code_prefix_hash"]
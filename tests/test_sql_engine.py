@@ -0,0 +1,47 @@
+import pandas as pd
+import pytest
+
+pytest.importorskip("duckdb")
+
+from modules.sql_engine import create_views, get_table_sources, make_sql_helper, open_connection  # noqa: E402
+
+
+@pytest.fixture
+def tables(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    pd.DataFrame({"order_id": range(10), "customer_id": [i % 3 for i in range(10)],
+                  "amount": [float(i) for i in range(10)]}).to_csv(tmp_path / "orders.csv", index=False)
+    pd.DataFrame({"customer_id": [0, 1, 2], "city": ["北京", "上海", "广州"]}).to_csv(
+        tmp_path / "2024 customers.csv", index=False
+    )
+    return get_table_sources({
+        "orders.csv": str(tmp_path / "orders.csv"),
+        "2024 customers.csv": str(tmp_path / "2024 customers.csv")
+    })
+
+
+def test_files_are_joined_across_views(tables):
+    assert [table["name"] for table in tables] == ["t_2024_customers", "orders"]
+    con = open_connection(memory_limit_mb=256, threads=1)
+    try:
+        create_views(con, tables)
+        result = make_sql_helper(con)("""
+            SELECT c.city, SUM(o.amount) AS total
+            FROM orders o JOIN t_2024_customers c USING (customer_id)
+            GROUP BY c.city ORDER BY c.city
+        """)
+    finally:
+        con.close()
+    assert dict(zip(result["city"], result["total"])) == {"上海": 12.0, "北京": 18.0, "广州": 15.0}
+
+
+def test_result_row_cap(tables):
+    con = open_connection(memory_limit_mb=256, threads=1)
+    try:
+        create_views(con, tables)
+        sql = make_sql_helper(con, max_rows=5)
+        assert len(sql("SELECT * FROM orders LIMIT 5")) == 5
+        with pytest.raises(ValueError, match="超过 5 行"):
+            sql("SELECT * FROM orders")
+    finally:
+        con.close()